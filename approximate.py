@@ -0,0 +1,188 @@
+## This file contains the approximate estimation of the ATE on growing stratified subsamples. The sample grows
+## until the confidence interval is narrower than the requested width.
+import numpy as np
+from scipy.stats import norm
+
+from nuisance import NuisanceCache, aipw_scores, nuisance_estimate
+
+APPROXIMATE_METHODS = ["linear_regression", "aipw", "dml"]
+
+
+def stratified_order(codes, rng):
+    """
+    Orders the rows so that every prefix of the order is a stratified random sample (each stratum appears in
+    proportion to its size)
+
+    Args:
+        codes: (np.ndarray[int]) the stratum code (0 ... n_strata - 1) of each row
+        rng: (np.random.Generator)
+
+    Returns:
+        (np.ndarray[int]) the order of the rows
+    """
+
+    n = len(codes)
+    order = rng.permutation(n)
+    codes = codes[order]
+    counts = np.bincount(codes)
+    by_stratum = np.argsort(codes, kind="stable")
+    position = np.empty(n)
+    position[by_stratum] = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    rank = (position + rng.random(n)) / counts[codes]
+
+    return order[np.argsort(rank, kind="stable")]
+
+
+class RegressionSketch:
+    """
+    Sufficient statistics of the regression of the outcome on [1, treatment, adjustment, treatment x effect
+    modifiers] (the features of DoWhy's backdoor.linear_regression). Rows are added in batches, so growing the
+    sample only processes the new rows.
+
+    Attributes:
+        ztz: (np.ndarray) Z'Z
+        zty: (np.ndarray) Z'y
+        yty: (float) y'y
+        n: (int) number of rows added
+    """
+
+    def __init__(self, n_features):
+
+        self.ztz = np.zeros((n_features, n_features))
+        self.zty = np.zeros(n_features)
+        self.yty = 0.0
+        self.n = 0
+
+    def add(self, Z, y):
+        """
+        adds a batch of rows
+        """
+
+        self.ztz += Z.T @ Z
+        self.zty += Z.T @ y
+        self.yty += float(y @ y)
+        self.n += len(y)
+
+    def estimate(self, contrast=None):
+        """
+        Args:
+            contrast: (np.ndarray / None) the weights of the coefficients in the effect. Defaults to the
+                      treatment coefficient
+
+        Returns:
+            (float) the effect
+            (float) its standard error
+        """
+
+        inverse = np.linalg.pinv(self.ztz)
+        beta = inverse @ self.zty
+        rss = max(self.yty - 2 * beta @ self.zty + beta @ self.ztz @ beta, 0.0)
+        sigma2 = rss / max(self.n - len(beta), 1)
+        if contrast is None:
+            contrast = np.zeros(len(beta))
+            contrast[1] = 1.0
+
+        return float(contrast @ beta), float(np.sqrt(sigma2 * (contrast @ inverse @ contrast)))
+
+
+def subsample_estimate(method, X, t, y, n_folds, seed, n_jobs=-1):
+    """
+    Estimates the ATE and its standard error on a subsample with the nuisance-based estimators
+
+    Args:
+        method: (str) aipw / dml
+        X: (np.ndarray) the adjustment variables
+        t: (np.ndarray) the binary treatment
+        y: (np.ndarray) the outcome
+        n_folds: (int) number of cross-fitting folds
+        seed: (int) seed of the fold split
+        n_jobs: (int) number of folds fitted in parallel
+
+    Returns:
+        (float) the estimate
+        (float) its standard error
+    """
+
+    nuisance = NuisanceCache().get(X, t, y, n_folds=n_folds, n_jobs=n_jobs, seed=seed)
+    estimate = nuisance_estimate(method, nuisance, t, y)
+    if method == "aipw":
+        scores = aipw_scores(nuisance, t, y)
+    else:
+        t_res = t - nuisance["m"]
+        scores = t_res * (y - nuisance["l"] - estimate * t_res) / np.mean(t_res ** 2)
+
+    return estimate, float(np.std(scores, ddof=1) / np.sqrt(len(y)))
+
+
+def approximate_effect(data, treat_var, outcome_var, adjustment, width, method="linear_regression",
+                       confidence=0.95, initial_size=1000, growth=2.0, stratify_on=None, n_folds=2, seed=0,
+                       n_jobs=-1, effect_modifiers=()):
+    """
+    Estimates the ATE on stratified subsamples of growing size, stopping once the confidence interval is
+    narrower than width. The interval includes the finite population correction, so it shrinks to zero
+    when the whole data is used.
+
+    Args:
+        data: (pd.DataFrame) the data
+        treat_var: (str) the treatment variable
+        outcome_var: (str) the outcome variable
+        adjustment: (List[str]) the adjustment set
+        width: (float) the requested width of the confidence interval
+        method: (str) linear_regression (sketched) / aipw / dml (refitted on each subsample)
+        confidence: (float) the confidence level
+        initial_size: (int) size of the first subsample
+        growth: (float) factor by which the subsample grows
+        stratify_on: (List[str] / None) columns defining the strata (default: the treatment)
+        n_folds: (int) number of cross-fitting folds of aipw / dml
+        seed: (int) the random seed
+        n_jobs: (int) number of folds of aipw / dml fitted in parallel
+        effect_modifiers: (List[str]) the effect modifiers of linear_regression. As in DoWhy, the regression
+                          has a treatment x modifier interaction for each of them, and the interactions are
+                          averaged over the sample
+
+    Returns:
+        (dict) the estimate, the error bound (half-width of the interval), the fraction and number of rows used
+    """
+
+    if method not in APPROXIMATE_METHODS:
+        raise ValueError(f"{method} is not supported by the approximate estimation. "
+                         f"Use one of {APPROXIMATE_METHODS} or the exact estimation")
+    rng = np.random.default_rng(seed)
+    n_rows = len(data)
+    codes = data.groupby(stratify_on or [treat_var], sort=False, dropna=False).ngroup().to_numpy()
+    order = stratified_order(codes, rng)
+    ## the rows of each subsample are read from the data when the sample grows, so only the rows that are
+    ## used are copied. The adjustment set comes first, then the effect modifiers, the treatment and the outcome
+    modifiers = list(effect_modifiers) if method == "linear_regression" else []
+    positions = data.columns.get_indexer(list(adjustment) + modifiers + [treat_var, outcome_var])
+    n_adjust = len(adjustment)
+    z = norm.ppf(0.5 + confidence / 2)
+
+    sketch = RegressionSketch(2 + n_adjust + len(modifiers))
+    modifier_sums = np.zeros(len(modifiers))
+    batches = []
+    used = 0
+    size = min(initial_size, n_rows)
+    while True:
+        batch = data.iloc[order[used:size], positions].to_numpy(dtype=float)
+        used = size
+        if method == "linear_regression":
+            treatment = batch[:, -2:-1]
+            sketch.add(np.column_stack([np.ones(len(batch)), treatment, batch[:, :n_adjust],
+                                        treatment * batch[:, n_adjust:-2]]), batch[:, -1])
+            modifier_sums += batch[:, n_adjust:-2].sum(axis=0)
+            ## the effect is the treatment coefficient plus the interactions at the mean of the modifiers
+            contrast = np.concatenate([[0.0, 1.0], np.zeros(n_adjust), modifier_sums / size])
+            estimate, se = sketch.estimate(contrast)
+        else:
+            batches.append(batch)
+            sample = np.concatenate(batches)
+            estimate, se = subsample_estimate(method, sample[:, :-2], sample[:, -2], sample[:, -1], n_folds, seed,
+                                              n_jobs)
+        bound = z * se * np.sqrt(1 - size / n_rows)
+        print("Approximate estimate on {} rows: {:.4f} +/- {:.4f}".format(size, estimate, bound))
+        if 2 * bound <= width or size == n_rows:
+            break
+        size = min(int(size * growth), n_rows)
+
+    return {"estimate": estimate, "error_bound": bound, "fraction": size / n_rows, "rows": size, "exact": False}
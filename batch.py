@@ -0,0 +1,333 @@
+## This file runs the GPT elicitation of a QRData-style benchmark in offline batches. The prompts of each
+## dataset form a chain, so every round submits the next prompt of all datasets as one batch:
+##   python batch.py prepare --json_filepath ... --data_folder ... --work_dir ...
+##   python batch.py ingest --work_dir ... --output_folder ... --data_name ...   (repeat until all rounds are done)
+
+import os
+import json
+import uuid
+import argparse
+import urllib.request
+from pathlib import Path
+import pandas as pd
+
+from gpt import DEFAULT_MODEL
+from prompt import CausalPrompt
+from query import CausalQuery
+from inference import DowhyInference
+
+OPENAI_URL = "https://api.openai.com/v1"
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the OpenAI batch API, used for testing without network access. Each request
+    is answered by the responder and the results are written in the format of the OpenAI batch output.
+
+    Attributes:
+        work_dir: (Path) folder where the output files are written
+        responder: (callable) maps (custom_id, messages) to the answer
+    """
+
+    def __init__(self, work_dir, responder):
+
+        self.work_dir = Path(work_dir)
+        self.responder = responder
+
+    def submit(self, batch_file):
+        """
+        Args:
+            batch_file: (Path) the JSONL file of requests
+
+        Returns:
+            (str) the id of the batch
+        """
+
+        batch_id = f"local_{uuid.uuid4().hex}"
+        with open(batch_file, "r") as f_in, open(self.work_dir / f"{batch_id}_output.jsonl", "w") as f_out:
+            for line in f_in:
+                request = json.loads(line)
+                answer = self.responder(request["custom_id"], request["body"]["messages"])
+                result = {"id": uuid.uuid4().hex, "custom_id": request["custom_id"], "error": None,
+                          "response": {"status_code": 200,
+                                       "body": {"choices": [{"message": {"role": "assistant", "content": answer}}]}}}
+                f_out.write(json.dumps(result) + "\n")
+
+        return batch_id
+
+    def retrieve(self, batch_id):
+        """
+        Args:
+            batch_id: (str) the id of the batch
+
+        Returns:
+            (Path / None) the output file, None if the batch is not completed
+        """
+
+        path = self.work_dir / f"{batch_id}_output.jsonl"
+
+        return path if path.exists() else None
+
+
+class OpenAIBatchBackend:
+    """
+    Submits the batch files to the OpenAI batch API
+
+    Attributes:
+        work_dir: (Path) folder where the output files are downloaded
+    """
+
+    def __init__(self, work_dir):
+
+        self.work_dir = Path(work_dir)
+        self.api_key = os.getenv('OPENAI_API_KEY')
+
+    def request(self, path, data=None, content_type="application/json"):
+        """
+        Sends a request to the OpenAI API
+
+        Args:
+            path: (str) the endpoint
+            data: (bytes / None) the body of a POST request
+            content_type: (str) the content type of the body
+
+        Returns:
+            (bytes) the response body
+        """
+
+        req = urllib.request.Request(f"{OPENAI_URL}{path}", data=data,
+                                     headers={"Authorization": f"Bearer {self.api_key}",
+                                              "Content-Type": content_type})
+        with urllib.request.urlopen(req) as response:
+            return response.read()
+
+    def submit(self, batch_file):
+        """
+        Uploads the batch file and creates the batch
+
+        Args:
+            batch_file: (Path) the JSONL file of requests
+
+        Returns:
+            (str) the id of the batch
+        """
+
+        boundary = uuid.uuid4().hex
+        with open(batch_file, "rb") as f:
+            content = f.read()
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"purpose\"\r\n\r\nbatch\r\n"
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{Path(batch_file).name}\"\r\n"
+                "Content-Type: application/jsonl\r\n\r\n").encode() + content + f"\r\n--{boundary}--\r\n".encode()
+        file_info = json.loads(self.request("/files", body, f"multipart/form-data; boundary={boundary}"))
+        batch = json.loads(self.request("/batches", json.dumps({"input_file_id": file_info["id"],
+                                                                 "endpoint": "/v1/chat/completions",
+                                                                 "completion_window": "24h"}).encode()))
+
+        return batch["id"]
+
+    def retrieve(self, batch_id):
+        """
+        Downloads the output of the batch if it is completed
+
+        Args:
+            batch_id: (str) the id of the batch
+
+        Returns:
+            (Path / None) the output file, None if the batch is not completed
+        """
+
+        batch = json.loads(self.request(f"/batches/{batch_id}"))
+        if batch["status"] in ["failed", "expired", "cancelled"]:
+            raise RuntimeError(f"Batch {batch_id} is {batch['status']}")
+        if batch["status"] != "completed":
+            print(f"Batch {batch_id} is {batch['status']}")
+            return None
+        path = self.work_dir / f"{batch_id}_output.jsonl"
+        with open(path, "wb") as f:
+            f.write(self.request(f"/files/{batch['output_file_id']}/content"))
+
+        return path
+
+
+def replay_responder(answers_file):
+    """
+    Creates a responder for LocalBatchBackend that answers with pre-recorded answers
+
+    Args:
+        answers_file: (str) JSON file mapping the data file name to the answers ({"treat": ..., "edges": ...})
+
+    Returns:
+        (callable)
+    """
+
+    with open(answers_file, "r") as f:
+        answers = json.load(f)
+
+    def respond(custom_id, messages):
+        item = json.loads(custom_id)
+        return answers[item["data_file"]].get(item["key"], "")
+
+    return respond
+
+
+def make_prompt(item, data_folder):
+    """
+    Args:
+        item: (dict) the state of a dataset
+        data_folder: (Path) folder containing the data
+
+    Returns:
+        (pd.DataFrame) the data
+        (CausalPrompt) the prompts of the dataset
+    """
+
+    data = pd.read_csv(Path(data_folder) / item["data_file"])
+
+    return data, CausalPrompt(item["query"], data=data, additional_info=item["additional_info"])
+
+
+def write_round(state, work_dir):
+    """
+    Writes the next prompt of every unfinished dataset to a JSONL batch file
+
+    Args:
+        state: (dict) the state of the batch run
+        work_dir: (Path) folder of the batch run
+
+    Returns:
+        (Path / None) the batch file, None if every dataset is finished
+    """
+
+    lines = []
+    for item in state["items"]:
+        _, prompt = make_prompt(item, state["data_folder"])
+        key = prompt.next_prompt(item["answers"])
+        if key is None:
+            continue
+        messages = prompt.build_history(item["answers"])
+        messages.append({"role": "user", "content": prompt.all_query_prompts[key]})
+        custom_id = json.dumps({"index": item["index"], "data_file": item["data_file"], "key": key})
+        lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                                 "body": {"model": state["model"], "messages": messages,
+                                          "temperature": 1, "top_p": 0.001}}))
+    if len(lines) == 0:
+        return None
+
+    batch_file = Path(work_dir) / f"round_{state['round']}.jsonl"
+    with open(batch_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return batch_file
+
+
+def ingest_results(state, output_file):
+    """
+    Adds the answers of a completed batch to the state. Failed requests are sent again in the next round.
+
+    Args:
+        state: (dict) the state of the batch run
+        output_file: (Path) the output of the batch
+    """
+
+    with open(output_file, "r") as f:
+        for line in f:
+            result = json.loads(line)
+            item = json.loads(result["custom_id"])
+            response = result.get("response") or {}
+            if result.get("error") is not None or response.get("status_code") != 200:
+                print("Request {} failed: {}".format(result["custom_id"], result.get("error")))
+                continue
+            answer = response["body"]["choices"][0]["message"]["content"].strip()
+            state["items"][item["index"]]["answers"][item["key"]] = answer
+
+
+def run_inference(state, output_folder, data_name, method):
+    """
+    Builds the graphs from the answers and estimates the treatment effects, as in main/qrdata_main.py
+
+    Args:
+        state: (dict) the state of the batch run
+        output_folder: (str) location where output is saved
+        data_name: (str) name of the output file
+        method: (str) the default backdoor estimation method
+    """
+
+    result_dict = {"data_name": [], "true": [], "predicted_backdoor": [], "predicted_frontdoor": []}
+    for item in state["items"]:
+        data = pd.read_csv(Path(state["data_folder"]) / item["data_file"])
+        try:
+            cq = CausalQuery(item["query"], data=data, additional_info=item["additional_info"],
+                             max_reprompts=0, responses=item["answers"])
+        except ValueError as e:
+            print("Skipping {}: {}".format(item["data_file"], e))
+            continue
+        infer = DowhyInference(cq.get_graph(), data)
+        infer.identification()
+        estim = infer.backdoor_estimation(item["method"] or method)
+        frontdoor_estim = infer.frontdoor_estimation()
+
+        result_dict['data_name'].append(item["data_file"])
+        result_dict['true'].append(item["answer"])
+        result_dict['predicted_backdoor'].append(estim)
+        result_dict["predicted_frontdoor"].append(frontdoor_estim)
+        print("true:{}, predicted:{}, frontdoor: {}".format(item['answer'], estim, frontdoor_estim))
+
+    output_folder = Path(output_folder)
+    output_folder.mkdir(exist_ok=True, parents=True)
+    pd.DataFrame(result_dict).to_csv(output_folder / "{}.csv".format(data_name))
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("phase", choices=["prepare", "ingest"])
+    parser.add_argument("--work_dir", help="folder where the batch files and the state are kept")
+    parser.add_argument("--json_filepath", help="json files containing the necessary information")
+    parser.add_argument("--data_folder", help="folder containing the data")
+    parser.add_argument("--query", help="the causal query", default="")
+    parser.add_argument("--model", help="the GPT model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", choices=["openai", "local"], default="openai")
+    parser.add_argument("--answers", help="json file with the answers used by the local backend")
+    parser.add_argument("--output_folder", help="location where output is saved")
+    parser.add_argument("--data_name", help="name of the output file", default="batch")
+    parser.add_argument("--method", help="what method to use for estimation", default="linear_regression")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(exist_ok=True, parents=True)
+    state_file = work_dir / "state.json"
+    if args.backend == "local":
+        backend = LocalBatchBackend(work_dir, replay_responder(args.answers))
+    else:
+        backend = OpenAIBatchBackend(work_dir)
+
+    if args.phase == "prepare":
+        with open(args.json_filepath, "r") as f:
+            json_info = json.load(f)
+        items = [{"index": i, "data_file": q["data_files"][0], "query": args.query or q["question"],
+                  "additional_info": q["data_description"], "answer": float(q["answer"]),
+                  "method": q.get("method"), "answers": {}} for i, q in enumerate(json_info)]
+        state = {"data_folder": args.data_folder, "model": args.model, "round": 0, "batch_id": None,
+                 "items": items}
+    else:
+        with open(state_file, "r") as f:
+            state = json.load(f)
+        output_file = backend.retrieve(state["batch_id"])
+        if output_file is None:
+            raise SystemExit("The batch is not completed yet. Run ingest again later")
+        ingest_results(state, output_file)
+        state["round"] += 1
+
+    batch_file = write_round(state, work_dir)
+    if batch_file is not None:
+        state["batch_id"] = backend.submit(batch_file)
+        print("Submitted round {} as batch {}".format(state["round"], state["batch_id"]))
+    with open(state_file, "w") as f:
+        json.dump(state, f, indent=2)
+    if batch_file is None:
+        run_inference(state, args.output_folder, args.data_name, args.method)
@@ -0,0 +1,154 @@
+## this benchmarks the conversion of causal graphs to DOT / Ananke / GML for different graph sizes
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import networkx as nx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from graph import CausalGraph
+from compact_graph import CompactGraph
+from util import format_graph_DOT
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", help="number of edges of the benchmarked graphs", nargs="+", type=int,
+                        default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--repeats", help="number of repetitions of each measurement", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+
+    return parser.parse_args()
+
+
+def random_causal_graph(n_edges, rng):
+    """
+    generates the inputs of a random causal DAG with roughly n_edges / 2 nodes, 10% of them unobserved
+
+    Args:
+        n_edges: (int) the number of edges
+        rng: (np.random.Generator)
+
+    Returns:
+        (dict) the arguments of CausalGraph / CompactGraph.from_edges
+    """
+
+    n_nodes = max(n_edges // 2, 3)
+    src = rng.integers(0, n_nodes - 1, size=n_edges)
+    dst = src + 1 + (rng.random(n_edges) * (n_nodes - 1 - src)).astype(int)
+    names = [f"v{i}" for i in range(n_nodes)]
+    n_hidden = n_nodes // 10
+    hidden = set(names[1:1 + n_hidden])
+    edges = list({(names[u], names[v]) for u, v in zip(src.tolist(), dst.tolist())})
+    observed_edges = [e for e in edges if e[0] not in hidden and e[1] not in hidden]
+    hidden_edges = [e for e in edges if e[0] in hidden or e[1] in hidden]
+
+    return {"treat_var": names[0], "outcome_var": names[-1], "other_vars": names[1 + n_hidden:-1],
+            "edge_list": observed_edges, "unobserved_vars": list(hidden), "unobserved_edges": hidden_edges}
+
+
+def networkx_graph(spec):
+    """
+    builds the networkx graph of the causal graph, as CausalGraph.update_graph does
+
+    Args:
+        spec: (dict) output of random_causal_graph
+
+    Returns:
+        (nx.DiGraph)
+    """
+
+    graph = nx.DiGraph()
+    graph.add_node(spec["treat_var"], observed=True, treatment=True, outcome=False)
+    graph.add_node(spec["outcome_var"], observed=True, treatment=False, outcome=True)
+    for node in spec["other_vars"]:
+        graph.add_node(node, observed=True, treatment=False, outcome=False)
+    graph.add_edges_from([(u, v, {'observed': True}) for u, v in spec["edge_list"]])
+    for node in spec["unobserved_vars"]:
+        graph.add_node(node, observed=False, treatment=False, outcome=False)
+    graph.add_edges_from([(u, v, {'observed': False}) for u, v in spec["unobserved_edges"]])
+
+    return graph
+
+
+def networkx_ananke(graph):
+    """
+    the Ananke inputs computed on the networkx graph
+
+    Returns:
+        List[(str)], List[(str, str)], List[(str, str)]
+    """
+
+    nodes = [node for node, observed in graph.nodes(data="observed") if observed]
+    observed_edges = []
+    unobserved_edges = []
+    for u, v, observed in graph.edges(data="observed"):
+        (observed_edges if observed else unobserved_edges).append((u, v))
+
+    return nodes, observed_edges, unobserved_edges
+
+
+def networkx_pipeline(spec):
+    """
+    what CausalGraph cost before the compact representation: the networkx graph, the DOT graph for DoWhy and
+    the Ananke inputs
+    """
+
+    graph = networkx_graph(spec)
+
+    return format_graph_DOT(graph), networkx_ananke(graph)
+
+
+def causal_graph_pipeline(spec):
+    """
+    the same outputs from CausalGraph, which only builds the networkx graph when it is asked for
+    """
+
+    graph = CausalGraph(**spec)
+
+    return graph.to_dot(), graph.create_ananke_inputs()
+
+
+def best_time(func, repeats):
+    """
+    Returns:
+        (float) the fastest run of func in seconds
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    rng = np.random.default_rng(args.seed)
+    ## every measurement builds the graph from the edge list and then serializes it, as each caller has to
+    print(f"{'edges':>8} {'operation':>12} {'networkx (s)':>14} {'compact (s)':>14}")
+    for size in args.sizes:
+        spec = random_causal_graph(size, rng)
+        graph = networkx_graph(spec)
+        compact = CompactGraph.from_edges(**spec)
+        assert compact.to_dot() == format_graph_DOT(graph)
+        assert compact.to_ananke() == networkx_ananke(graph)
+        rows = {"build": (lambda: networkx_graph(spec), lambda: CompactGraph.from_edges(**spec)),
+                "dot": (lambda: format_graph_DOT(networkx_graph(spec)),
+                        lambda: CompactGraph.from_edges(**spec).to_dot()),
+                "ananke": (lambda: networkx_ananke(networkx_graph(spec)),
+                           lambda: CompactGraph.from_edges(**spec).to_ananke()),
+                "gml": (lambda: "\n".join(nx.generate_gml(networkx_graph(spec))),
+                        lambda: CompactGraph.from_edges(**spec).to_gml()),
+                "cycles": (lambda: nx.is_directed_acyclic_graph(networkx_graph(spec)),
+                           lambda: CompactGraph.from_edges(**spec).has_cycle()),
+                "causalgraph": (lambda: networkx_pipeline(spec), lambda: causal_graph_pipeline(spec))}
+        for name, (nx_func, compact_func) in rows.items():
+            print(f"{compact.num_edges():>8} {name:>12} {best_time(nx_func, args.repeats):>14.5f} "
+                  f"{best_time(compact_func, args.repeats):>14.5f}")
@@ -0,0 +1,243 @@
+## This file contains meta-learners for conditional (heterogeneous) treatment effects. The effects are predicted
+## in chunks, so scoring and aggregating over large tables uses bounded memory.
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+
+from nuisance import LEARNERS
+
+
+class MetaLearner:
+    """
+    Base class for the meta-learners
+
+    Attributes:
+        regressor: the base outcome model
+        classifier: the base propensity model (X-learner only)
+    """
+
+    def __init__(self, base="forest"):
+
+        if base not in LEARNERS:
+            raise ValueError(f"{base} is not a valid learner")
+        self.classifier, self.regressor = LEARNERS[base]
+
+    def fit(self, X, t, y):
+        """
+        fits the learner
+
+        Args:
+            X: (np.ndarray) the adjustment variables
+            t: (np.ndarray) the binary treatment
+            y: (np.ndarray) the outcome
+        """
+
+        pass
+
+    def effect(self, X):
+        """
+        Args:
+            X: (np.ndarray) the adjustment variables
+
+        Returns:
+            (np.ndarray) the treatment effect of each row
+        """
+
+        pass
+
+
+class SLearner(MetaLearner):
+    """
+    single outcome model with the treatment as a feature
+    """
+
+    def fit(self, X, t, y):
+
+        self.model = clone(self.regressor).fit(np.column_stack([X, t]), y)
+
+        return self
+
+    def effect(self, X):
+
+        n = len(X)
+        both = np.vstack([np.column_stack([X, np.ones(n)]), np.column_stack([X, np.zeros(n)])])
+        predictions = self.model.predict(both)
+
+        return predictions[:n] - predictions[n:]
+
+
+class TLearner(MetaLearner):
+    """
+    separate outcome models for the treated and the control rows
+    """
+
+    def fit(self, X, t, y):
+
+        self.model0 = clone(self.regressor).fit(X[t == 0], y[t == 0])
+        self.model1 = clone(self.regressor).fit(X[t == 1], y[t == 1])
+
+        return self
+
+    def effect(self, X):
+
+        return self.model1.predict(X) - self.model0.predict(X)
+
+
+class XLearner(TLearner):
+    """
+    T-learner whose imputed effects are regressed on the covariates and weighted by the propensity score
+    (Kunzel et al., 2019)
+    """
+
+    def fit(self, X, t, y):
+
+        super().fit(X, t, y)
+        treated, control = t == 1, t == 0
+        self.tau1 = clone(self.regressor).fit(X[treated], y[treated] - self.model0.predict(X[treated]))
+        self.tau0 = clone(self.regressor).fit(X[control], self.model1.predict(X[control]) - y[control])
+        self.propensity = clone(self.classifier).fit(X, t)
+
+        return self
+
+    def effect(self, X):
+
+        g = self.propensity.predict_proba(X)[:, 1]
+
+        return g * self.tau0.predict(X) + (1 - g) * self.tau1.predict(X)
+
+
+META_LEARNERS = {"s": SLearner, "t": TLearner, "x": XLearner}
+
+
+def iter_chunks(data, chunk_size):
+    """
+    Splits the data into chunks
+
+    Args:
+        data: (pd.DataFrame / iterable of pd.DataFrame) the data, e.g. pd.read_csv(..., chunksize=...)
+        chunk_size: (int) number of rows of each chunk of a DataFrame
+
+    Returns:
+        (generator[pd.DataFrame])
+    """
+
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+    else:
+        yield from data
+
+
+class CATEEstimator:
+    """
+    Conditional treatment effects on the adjustment set identified by DoWhy
+
+    Attributes:
+        treat_var: (str) the treatment variable
+        outcome_var: (str) the outcome variable
+        adjustment: (List[str]) the identified backdoor adjustment set
+        learner: (MetaLearner) the fitted meta-learner
+    """
+
+    def __init__(self, inference, learner="x", base="forest"):
+
+        if inference.estimand is None:
+            inference.identification(False)
+        if len(inference.estimand.get_backdoor_variables()) == 0:
+            raise ValueError("CATE estimation requires a backdoor adjustment set")
+        if learner not in META_LEARNERS:
+            raise ValueError(f"{learner} is not a valid meta-learner")
+        self.treat_var = inference.treat_var
+        self.outcome_var = inference.outcome_var
+        self.adjustment = list(inference.estimand.get_backdoor_variables())
+        self.learner = META_LEARNERS[learner](base)
+        self.data = inference.data
+
+    def fit(self, data=None):
+        """
+        Fits the meta-learner
+
+        Args:
+            data: (pd.DataFrame / None) the training data. Defaults to the data of the inference
+
+        Returns:
+            (CATEEstimator)
+        """
+
+        data = self.data if data is None else data
+        t = data[self.treat_var].to_numpy(dtype=float)
+        if not np.isin(t, [0, 1]).all():
+            raise ValueError("CATE estimation requires a binary treatment")
+        self.learner.fit(data[self.adjustment].to_numpy(dtype=float), t, data[self.outcome_var].to_numpy(dtype=float))
+
+        return self
+
+    def effect_batches(self, data, chunk_size=100000):
+        """
+        Predicts the treatment effect of each row, one chunk at a time
+
+        Args:
+            data: (pd.DataFrame / iterable of pd.DataFrame) the rows to score
+            chunk_size: (int) number of rows per chunk
+
+        Returns:
+            (generator[(pd.DataFrame, np.ndarray)]) each chunk and its effects
+        """
+
+        for chunk in iter_chunks(data, chunk_size):
+            yield chunk, self.learner.effect(chunk[self.adjustment].to_numpy(dtype=float))
+
+    def effect(self, data, chunk_size=100000):
+        """
+        Args:
+            data: (pd.DataFrame) the rows to score
+            chunk_size: (int) number of rows per chunk
+
+        Returns:
+            (np.ndarray) the treatment effect of each row
+        """
+
+        return np.concatenate([effects for _, effects in self.effect_batches(data, chunk_size)])
+
+    def segment_effects(self, data, by, chunk_size=100000):
+        """
+        Aggregates the effects over segments. Only the per-segment sums are kept between chunks
+
+        Args:
+            data: (pd.DataFrame / iterable of pd.DataFrame) the rows to score
+            by: (str / List[str]) the columns defining the segments
+            chunk_size: (int) number of rows per chunk
+
+        Returns:
+            (pd.DataFrame) number of rows, mean and standard deviation of the effect of each segment
+        """
+
+        by = [by] if isinstance(by, str) else list(by)
+        totals = None
+        for chunk, effects in self.effect_batches(data, chunk_size):
+            frame = chunk[by].assign(effect=effects, effect_sq=effects ** 2, count=1)
+            sums = frame.groupby(by)[["count", "effect", "effect_sq"]].sum()
+            totals = sums if totals is None else totals.add(sums, fill_value=0)
+
+        mean = totals["effect"] / totals["count"]
+        variance = (totals["effect_sq"] / totals["count"] - mean ** 2).clip(lower=0)
+
+        return pd.DataFrame({"count": totals["count"].astype(int), "mean_effect": mean,
+                             "std_effect": np.sqrt(variance)})
+
+    def average_effect(self, data=None, chunk_size=100000):
+        """
+        Args:
+            data: (pd.DataFrame / iterable of pd.DataFrame / None) the rows. Defaults to the data of the inference
+            chunk_size: (int) number of rows per chunk
+
+        Returns:
+            (float) the mean of the conditional effects (ATE)
+        """
+
+        total, count = 0.0, 0
+        for _, effects in self.effect_batches(self.data if data is None else data, chunk_size):
+            total += float(effects.sum())
+            count += len(effects)
+
+        return total / count
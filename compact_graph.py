@@ -0,0 +1,250 @@
+## This file defines a compact, array-backed representation of the causal graph. CausalGraph builds it from the
+## elicited edges and uses it to serialize the graph for DoWhy / Ananke
+import numpy as np
+import networkx as nx
+
+## bit flags stored per node
+OBSERVED = 1
+TREATMENT = 2
+OUTCOME = 4
+
+
+class CompactGraph:
+    """
+    Causal graph with integer node ids, CSR adjacency and per-node bit flags. The serializers build
+    their output in a single pass over the arrays.
+
+    Attributes:
+        names: (List[str]) node names, indexed by node id
+        flags: (np.ndarray[uint8]) OBSERVED / TREATMENT / OUTCOME bits of each node
+        indptr: (np.ndarray[int64]) the children of node i are indices[indptr[i]:indptr[i + 1]]
+        indices: (np.ndarray[int64]) target node of each edge, grouped by source node
+        edge_observed: (np.ndarray[bool]) whether each edge (in the order of indices) is observed
+    """
+
+    def __init__(self, names, flags, indptr, indices, edge_observed):
+
+        self.names = names
+        self.flags = flags
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_observed = edge_observed
+
+    @classmethod
+    def from_edges(cls, treat_var, outcome_var, other_vars, edge_list, unobserved_vars=None,
+                   unobserved_edges=None):
+        """
+        Builds the graph from the same inputs as CausalGraph
+
+        Args:
+            treat_var: (str) the treatment variable
+            outcome_var: (str) the outcome variable
+            other_vars: (List[str]) the other observed variables
+            edge_list: (List[(str, str)]) observed edges
+            unobserved_vars: (List[str] / None) unobserved variables
+            unobserved_edges: (List[(str, str)] / None) edges involving the unobserved variables
+
+        Returns:
+            (CompactGraph)
+        """
+
+        ids = {}
+        names = []
+        flags = []
+
+        def add_node(node, flag):
+            if node not in ids:
+                ids[node] = len(names)
+                names.append(node)
+                flags.append(flag)
+            else:
+                flags[ids[node]] = flag
+
+        ## nodes and edges are added in the same order as CausalGraph.update_graph, so the node ids and the
+        ## edge order follow the networkx graph. Later edges overwrite the observed attribute of duplicates
+        edges = {}
+
+        def add_edges(edge_group, observed):
+            for u, v in edge_group:
+                for node in (u, v):
+                    if node not in ids:
+                        add_node(node, OBSERVED)
+                edges[(ids[u], ids[v])] = observed
+
+        add_node(treat_var, OBSERVED | TREATMENT)
+        add_node(outcome_var, OBSERVED | OUTCOME)
+        for node in other_vars:
+            add_node(node, OBSERVED)
+        add_edges(edge_list, True)
+        for node in unobserved_vars or []:
+            add_node(node, 0)
+        add_edges(unobserved_edges or [], False)
+
+        return cls.from_arrays(names, np.array(flags, dtype=np.uint8),
+                               np.fromiter((e[0] for e in edges), dtype=np.int64, count=len(edges)),
+                               np.fromiter((e[1] for e in edges), dtype=np.int64, count=len(edges)),
+                               np.fromiter(edges.values(), dtype=bool, count=len(edges)))
+
+    @classmethod
+    def from_arrays(cls, names, flags, src, dst, observed):
+        """
+        Builds the CSR adjacency from edge arrays
+
+        Args:
+            names: (List[str]) node names
+            flags: (np.ndarray[uint8]) node flags
+            src: (np.ndarray[int64]) source node of each edge
+            dst: (np.ndarray[int64]) target node of each edge
+            observed: (np.ndarray[bool]) whether each edge is observed
+
+        Returns:
+            (CompactGraph)
+        """
+
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(names)), out=indptr[1:])
+
+        return cls(names, flags, indptr, dst[order], observed[order])
+
+    def num_nodes(self):
+        """
+        Returns:
+            (int) the number of nodes
+        """
+
+        return len(self.names)
+
+    def num_edges(self):
+        """
+        Returns:
+            (int) the number of edges
+        """
+
+        return len(self.indices)
+
+    def sources(self):
+        """
+        Returns:
+            (np.ndarray[int64]) source node of each edge, aligned with indices
+        """
+
+        return np.repeat(np.arange(len(self.names), dtype=np.int64), np.diff(self.indptr))
+
+    def nodes_with(self, flag):
+        """
+        Args:
+            flag: (int) OBSERVED / TREATMENT / OUTCOME
+
+        Returns:
+            (List[str]) names of the nodes with the flag set
+        """
+
+        return [self.names[i] for i in np.flatnonzero(self.flags & flag)]
+
+    def children(self, node_id):
+        """
+        Args:
+            node_id: (int)
+
+        Returns:
+            (np.ndarray[int64]) ids of the children of the node
+        """
+
+        return self.indices[self.indptr[node_id]:self.indptr[node_id + 1]]
+
+    def has_cycle(self):
+        """
+        Detects if the graph contains a cycle (Kahn's algorithm)
+
+        Returns:
+            (bool)
+        """
+
+        in_degree = np.bincount(self.indices, minlength=len(self.names)).tolist()
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        stack = [node for node, degree in enumerate(in_degree) if degree == 0]
+        visited = 0
+        while stack:
+            node = stack.pop()
+            visited += 1
+            for child in indices[indptr[node]:indptr[node + 1]]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    stack.append(child)
+
+        return visited != len(self.names)
+
+    def edges(self):
+        """
+        Returns:
+            List[(str, str)]: the edges, grouped by source node
+        """
+
+        names = self.names
+
+        return [(names[u], names[v]) for u, v in zip(self.sources().tolist(), self.indices.tolist())]
+
+    def to_networkx(self):
+        """
+        Returns:
+            (nx.DiGraph) the graph with the node / edge attributes of CausalGraph
+        """
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from((name, {"observed": bool(flag & OBSERVED), "treatment": bool(flag & TREATMENT),
+                                     "outcome": bool(flag & OUTCOME)})
+                             for name, flag in zip(self.names, self.flags.tolist()))
+        graph.add_edges_from((u, v, {"observed": obs}) for (u, v), obs in zip(self.edges(),
+                                                                               self.edge_observed.tolist()))
+
+        return graph
+
+    def to_dot(self):
+        """
+        Returns:
+            (str) the graph in DOT format (same output as util.format_graph_DOT)
+        """
+
+        names = self.names
+        body = "".join([f"{names[u]} -> {names[v]};\n" for u, v in zip(self.sources().tolist(),
+                                                                        self.indices.tolist())])
+
+        return "digraph {\n" + body + "}"
+
+    def to_ananke(self):
+        """
+        Returns:
+            List[(str)]: the observed nodes
+            List[(str, str)]: directed (observed) edges
+            List[(str, str)]: the unobserved edges
+        """
+
+        names = self.names
+        src = self.sources()
+        observed = self.edge_observed
+        nodes = self.nodes_with(OBSERVED)
+        di_edges = [(names[u], names[v]) for u, v in zip(src[observed].tolist(), self.indices[observed].tolist())]
+        bi_edges = [(names[u], names[v]) for u, v in zip(src[~observed].tolist(), self.indices[~observed].tolist())]
+
+        return nodes, di_edges, bi_edges
+
+    def to_gml(self):
+        """
+        Returns:
+            (str) the graph in GML format, readable by nx.parse_gml
+        """
+
+        names = self.names
+        flags = self.flags.tolist()
+        lines = ["graph [", "  directed 1"]
+        lines.extend([f'  node [ id {i} label "{name}" observed {flag & OBSERVED} '
+                      f'treatment {(flag & TREATMENT) >> 1} outcome {(flag & OUTCOME) >> 2} ]'
+                      for i, (name, flag) in enumerate(zip(names, flags))])
+        lines.extend([f"  edge [ source {u} target {v} observed {int(obs)} ]"
+                      for u, v, obs in zip(self.sources().tolist(), self.indices.tolist(),
+                                           self.edge_observed.tolist())])
+        lines.append("]")
+
+        return "\n".join(lines)
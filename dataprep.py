@@ -0,0 +1,84 @@
+## This file contains functions that prepare the data handed to the estimators: only the columns required by
+## the estimand are kept, and they are stored with the smallest lossless dtype
+import numpy as np
+import pandas as pd
+
+INT_TYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+
+def required_columns(treat_var, outcome_var, estimand, effect_modifiers=()):
+    """
+    Lists the columns needed to estimate the effect
+
+    Args:
+        treat_var: (str) the treatment variable
+        outcome_var: (str) the outcome variable
+        estimand: (IdentifiedEstimand) the estimand found by DoWhy
+        effect_modifiers: (List[str]) the effect modifiers of the DoWhy model (CausalModel.get_effect_modifiers),
+                          which its estimators add to the regressions when they are in the data
+
+    Returns:
+        (List[str])
+    """
+
+    columns = [treat_var, outcome_var]
+    for variables in [estimand.get_backdoor_variables(), estimand.get_frontdoor_variables(),
+                      estimand.get_instrumental_variables(), sorted(effect_modifiers)]:
+        columns.extend(var for var in variables if var not in columns)
+
+    return columns
+
+
+def downcast(values):
+    """
+    Converts the array to the smallest dtype that represents every value exactly
+
+    Args:
+        values: (np.ndarray)
+
+    Returns:
+        (np.ndarray)
+    """
+
+    if values.dtype.kind in "iu" and len(values) != 0:
+        low, high = values.min(), values.max()
+        for dtype in INT_TYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return values.astype(dtype) if dtype != values.dtype else values
+    elif values.dtype == np.float64:
+        compact = values.astype(np.float32)
+        if np.array_equal(compact.astype(np.float64), values, equal_nan=True):
+            return compact
+
+    return values
+
+
+def compact_frame(data, columns, keep_dtype=(), downcast_columns=True):
+    """
+    Selects the columns and downcasts them. Each column is stored as a contiguous array and the frame is
+    built from them without an intermediate copy of the full data.
+
+    Args:
+        data: (pd.DataFrame) the full data
+        columns: (List[str]) the columns to keep
+        keep_dtype: (List[str]) columns that keep their dtype
+        downcast_columns: (bool) whether to downcast the columns
+
+    Returns:
+        (pd.DataFrame) the compact data
+        (dict) the number of columns and the memory (in bytes) before / after
+    """
+
+    arrays = {}
+    for col in columns:
+        values = np.ascontiguousarray(data[col].to_numpy())
+        arrays[col] = downcast(values) if downcast_columns and col not in keep_dtype else values
+    compact = pd.DataFrame(arrays, index=data.index, copy=False)
+
+    before = int(data.memory_usage(deep=True).sum())
+    after = int(compact.memory_usage(deep=True).sum())
+    report = {"columns_before": data.shape[1], "columns_after": compact.shape[1],
+              "bytes_before": before, "bytes_after": after, "bytes_saved": before - after}
+
+    return compact, report
@@ -0,0 +1,228 @@
+## This file contains functions for learning the causal structure from data (PC algorithm)
+import itertools
+import numpy as np
+import networkx as nx
+from scipy.stats import norm
+from concurrent.futures import ThreadPoolExecutor
+from profiling import traced
+
+
+def partial_correlations(corr, i, j, cond_sets):
+    """
+    Computes the partial correlation of i and j given each conditioning set in one batched matrix inversion
+
+    Args:
+        corr: (np.ndarray) the correlation matrix of the data
+        i: (int) index of the first variable
+        j: (int) index of the second variable
+        cond_sets: (np.ndarray[int]) (m, l) array with one conditioning set per row
+
+    Returns:
+        (np.ndarray) the m partial correlations
+    """
+
+    m = cond_sets.shape[0]
+    idx = np.concatenate([np.full((m, 1), i), np.full((m, 1), j), cond_sets], axis=1)
+    sub = corr[idx[:, :, None], idx[:, None, :]]
+    prec = np.linalg.pinv(sub)
+
+    return -prec[:, 0, 1] / np.sqrt(prec[:, 0, 0] * prec[:, 1, 1])
+
+
+def fisher_z_pvalues(pcorr, n_samples, cond_size):
+    """
+    Computes the p-values of the Fisher z test of zero partial correlation
+
+    Args:
+        pcorr: (np.ndarray) partial correlations
+        n_samples: (int) number of rows of the data
+        cond_size: (int) size of the conditioning sets
+
+    Returns:
+        (np.ndarray)
+    """
+
+    z = np.arctanh(np.clip(pcorr, -0.9999999, 0.9999999))
+    stat = np.sqrt(max(n_samples - cond_size - 3, 1)) * np.abs(z)
+
+    return 2 * norm.sf(stat)
+
+
+def test_edge(corr, n_samples, adjacency, i, j, cond_size, alpha):
+    """
+    Tests whether i and j are independent given some subset of size cond_size of their neighbours
+
+    Args:
+        corr: (np.ndarray) the correlation matrix of the data
+        n_samples: (int) number of rows of the data
+        adjacency: (List[set]) neighbours of each variable at the start of the level
+        i: (int) index of the first variable
+        j: (int) index of the second variable
+        cond_size: (int) size of the conditioning sets
+        alpha: (float) significance level
+
+    Returns:
+        (tuple / None) the separating set if the edge is removed, None otherwise
+    """
+
+    cond_sets = set()
+    for neighbours in [adjacency[i] - {j}, adjacency[j] - {i}]:
+        cond_sets.update(itertools.combinations(sorted(neighbours), cond_size))
+    if len(cond_sets) == 0:
+        return None
+
+    cond_sets = sorted(cond_sets)
+    pvalues = fisher_z_pvalues(partial_correlations(corr, i, j, np.array(cond_sets, dtype=int)),
+                               n_samples, cond_size)
+    best = int(np.argmax(pvalues))
+
+    return cond_sets[best] if pvalues[best] > alpha else None
+
+
+def pc_skeleton(data, alpha=0.05, max_cond_size=3, n_jobs=1):
+    """
+    Learns the skeleton of the graph with the (order-independent) PC algorithm, using partial correlation
+    tests. The tests of one level are batched per edge, and the edges can be tested in parallel.
+
+    Args:
+        data: (pd.DataFrame) numerical data
+        alpha: (float) significance level of the independence tests
+        max_cond_size: (int) largest conditioning set that is tested
+        n_jobs: (int) number of threads used for testing the edges
+
+    Returns:
+        (List[set]) neighbours of each variable (indices follow data.columns)
+        (dict) maps the removed pairs (i, j), i < j, to their separating set
+    """
+
+    values = data.to_numpy(dtype=float)
+    n_samples, n_vars = values.shape
+    corr = np.corrcoef(values, rowvar=False)
+
+    ## level 0: all pairs at once
+    pvalues = fisher_z_pvalues(corr, n_samples, 0)
+    adjacency = [set() for _ in range(n_vars)]
+    sepsets = {}
+    for i, j in itertools.combinations(range(n_vars), 2):
+        if pvalues[i, j] > alpha:
+            sepsets[(i, j)] = ()
+        else:
+            adjacency[i].add(j)
+            adjacency[j].add(i)
+
+    for cond_size in range(1, max_cond_size + 1):
+        edges = [(i, j) for i in range(n_vars) for j in adjacency[i] if i < j and
+                 max(len(adjacency[i]), len(adjacency[j])) > cond_size]
+        if len(edges) == 0:
+            break
+        frozen = [set(neighbours) for neighbours in adjacency]
+        if n_jobs > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(lambda e: test_edge(corr, n_samples, frozen, e[0], e[1],
+                                                                cond_size, alpha), edges))
+        else:
+            results = [test_edge(corr, n_samples, frozen, i, j, cond_size, alpha) for i, j in edges]
+        for (i, j), sepset in zip(edges, results):
+            if sepset is not None:
+                adjacency[i].discard(j)
+                adjacency[j].discard(i)
+                sepsets[(i, j)] = sepset
+
+    return adjacency, sepsets
+
+
+def orient_edges(adjacency, sepsets):
+    """
+    Orients the v-structures of the skeleton and propagates the orientations (Meek rule 1)
+
+    Args:
+        adjacency: (List[set]) neighbours of each variable
+        sepsets: (dict) separating sets of the removed pairs
+
+    Returns:
+        (set[(int, int)]) directed edges
+        (set[(int, int)]) undirected edges (i < j)
+    """
+
+    n_vars = len(adjacency)
+    directed = set()
+    for k in range(n_vars):
+        for i, j in itertools.combinations(sorted(adjacency[k]), 2):
+            if j not in adjacency[i] and k not in sepsets.get((i, j), ()):
+                if (k, i) not in directed and (k, j) not in directed:
+                    directed.update([(i, k), (j, k)])
+
+    undirected = {(i, j) for i in range(n_vars) for j in adjacency[i]
+                  if i < j and (i, j) not in directed and (j, i) not in directed}
+    changed = True
+    while changed:
+        changed = False
+        for i, j in sorted(undirected):
+            for a, b in [(i, j), (j, i)]:
+                if any(p not in adjacency[b] and p != b for p, c in directed if c == a):
+                    directed.add((a, b))
+                    undirected.discard((i, j))
+                    changed = True
+                    break
+
+    return directed, undirected
+
+
+@traced()
+def discover_structure(data, alpha=0.05, max_cond_size=3, n_jobs=1):
+    """
+    Learns a partially directed graph from the numerical columns of the data
+
+    Args:
+        data: (pd.DataFrame) the data
+        alpha: (float) significance level of the independence tests
+        max_cond_size: (int) largest conditioning set that is tested
+        n_jobs: (int) number of threads used for testing the edges
+
+    Returns:
+        (dict) the variables, the directed edges and the undirected edges (by column name)
+    """
+
+    numeric = data.select_dtypes(include=[np.number, bool])
+    numeric = numeric.loc[:, numeric.std() > 0]
+    dropped = [col for col in data.columns if col not in numeric.columns]
+    if len(dropped) != 0:
+        print("Structure discovery ignores the non-numerical / constant columns: {}".format(dropped))
+
+    adjacency, sepsets = pc_skeleton(numeric, alpha, max_cond_size, n_jobs)
+    directed, undirected = orient_edges(adjacency, sepsets)
+    names = list(numeric.columns)
+
+    return {"variables": names,
+            "directed": sorted((names[i], names[j]) for i, j in directed),
+            "undirected": sorted((names[i], names[j]) for i, j in undirected)}
+
+
+def complete_orientation(structure, treat_var, outcome_var):
+    """
+    Orients the undirected edges of the discovered structure so that the result is a DAG. Undirected edges
+    follow the variable order with the treatment first and the outcome last. If the directed edges found
+    by discovery create a cycle, every edge follows the variable order.
+
+    Args:
+        structure: (dict) output of discover_structure
+        treat_var: (str) the treatment variable
+        outcome_var: (str) the outcome variable
+
+    Returns:
+        List[(str, str)]
+    """
+
+    order = [treat_var] + [var for var in structure["variables"] if var not in [treat_var, outcome_var]] + \
+            [outcome_var]
+    rank = {var: i for i, var in enumerate(order)}
+
+    def by_rank(u, v):
+        return (u, v) if rank.get(u, 0) < rank.get(v, 0) else (v, u)
+
+    edges = list(structure["directed"]) + [by_rank(u, v) for u, v in structure["undirected"]]
+    if not nx.is_directed_acyclic_graph(nx.DiGraph(edges)):
+        print("Discovered orientations contain a cycle. Orienting all edges by the variable order")
+        edges = [by_rank(u, v) for u, v in edges]
+
+    return edges
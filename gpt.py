@@ -2,9 +2,35 @@
 
 import openai
 import os
+import json
 from util import filter_str
+from graph import IncrementalDAG
+from profiling import traced
 
-def interface_gpt(messages, question, temperature=1, top_p=0.001):
+DEFAULT_MODEL = "gpt-4o"
+## cache of the responses, keyed by the model, sampling parameters and messages. None disables caching
+RESPONSE_CACHE = None
+
+def enable_response_cache(cache=None):
+    """
+    Enables caching of the GPT responses (used by long-running processes, e.g. service.py)
+
+    Args:
+        cache: (dict / None) the cache to use, e.g. a service.LRUCache to bound its size. A dict is created
+               if None
+
+    Returns:
+        (dict / LRUCache) the cache
+    """
+    global RESPONSE_CACHE
+    RESPONSE_CACHE = {} if cache is None else cache
+
+    return RESPONSE_CACHE
+
+
+@traced()
+def interface_gpt(messages, question, temperature=1, top_p=0.001, model=DEFAULT_MODEL, usage=None,
+                  use_cache=True):
     """
     Interfaces with GPT model to generate answer to a query via OpenAI API
 
@@ -13,6 +39,9 @@ def interface_gpt(messages, question, temperature=1, top_p=0.001):
         question: (str) the question of interest
         temperature: (float) the temperature to control the randomness
         top_p: (float) 0.5
+        model: (str) name of the model that answers the question
+        usage: (dict / None) if given, the prompt and completion token counts are added to it
+        use_cache: (bool) whether to look up / store the response in the response cache (if enabled)
 
     Returns:
         (str) response to the prompt
@@ -20,10 +49,21 @@ def interface_gpt(messages, question, temperature=1, top_p=0.001):
     openai.api_key = os.getenv('OPENAI_API_KEY')
 
     messages.append({"role":"user", "content":question})
+    cache_key = None
+    if RESPONSE_CACHE is not None and use_cache:
+        cache_key = json.dumps([model, temperature, top_p, messages])
+        cached = RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
     try:
-        response = openai.ChatCompletion.create(model="gpt-4o", messages=messages, temperature=temperature,
+        response = openai.ChatCompletion.create(model=model, messages=messages, temperature=temperature,
                                                 top_p=top_p)
         answer = response['choices'][0]['message']['content'].strip()
+        if usage is not None and "usage" in response:
+            for key in ["prompt_tokens", "completion_tokens"]:
+                usage[key] = usage.get(key, 0) + response["usage"][key]
+        if cache_key is not None:
+            RESPONSE_CACHE[cache_key] = answer
 
         return answer
     except Exception as e:
@@ -40,15 +80,122 @@ def extract_edges(edge_list):
     """
     new_edge_list = []
     for edge in edge_list:
-        edge_sp = edge.strip().split("->")
-        if len(edge_sp) != 1:
-            if len(edge_sp) == 2:
-                new_edge_list.append((filter_str(edge_sp[0].strip()), filter_str(edge_sp[1].strip())))
-            else:
-                raise ValueError(f"{edge} is not in right format")
+        parsed = parse_edge(edge)
+        if parsed is not None:
+            new_edge_list.append(parsed)
 
     return new_edge_list
 
+
+def parse_edge(edge):
+    """
+    parses a single line of the form node1 -> node2
+    Args:
+        edge: (str)
+    Returns:
+        (str, str) / None if the line is not an edge
+    """
+
+    edge_sp = edge.strip().split("->")
+    if len(edge_sp) == 1:
+        return None
+    if len(edge_sp) != 2:
+        raise ValueError(f"{edge} is not in right format")
+
+    return filter_str(edge_sp[0].strip()), filter_str(edge_sp[1].strip())
+
+
+@traced()
+def stream_gpt(messages, question, on_line, temperature=1, top_p=0.001, model=DEFAULT_MODEL):
+    """
+    Streams the answer of the GPT model and passes every completed line to on_line as soon as it arrives.
+    The request is aborted as soon as on_line reports a problem.
+
+    Args:
+        messages: (list[dict]) past history of user prompts and GPT responses
+        question: (str) the question of interest
+        on_line: (callable) called with each line; returns None to continue, or the reason to abort
+        temperature: (float) the temperature to control the randomness
+        top_p: (float) 0.5
+        model: (str) name of the model that answers the question
+
+    Returns:
+        (str) the response received so far
+        (str / None) the reason the request was aborted, None if it completed
+    """
+    openai.api_key = os.getenv('OPENAI_API_KEY')
+
+    messages.append({"role": "user", "content": question})
+    received = ""
+    pending = ""
+    try:
+        response = openai.ChatCompletion.create(model=model, messages=messages, temperature=temperature,
+                                                top_p=top_p, stream=True)
+        for chunk in response:
+            pending += chunk['choices'][0].get('delta', {}).get('content') or ""
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                received += line + "\n"
+                reason = on_line(line)
+                if reason is not None:
+                    if hasattr(response, "close"):
+                        response.close()
+                    return received.strip(), reason
+        received += pending
+
+        return received.strip(), on_line(pending) if len(pending.strip()) != 0 else None
+    except Exception as e:
+        print(f"Error interfacing with GPT: {e}")
+        return received.strip(), str(e)
+
+
+class StreamingEdgeParser:
+    """
+    Parses the edges of a streamed answer line by line, adding them to an incrementally maintained DAG.
+    Used as the on_line callback of stream_gpt, it aborts the answer once it is invalid.
+
+    Attributes:
+        index: (ColumnIndex / None) index over the data columns used to check the variable names
+        max_unknown: (int) how many unknown variables are tolerated before aborting
+        dag: (IncrementalDAG) the edges accepted so far
+        unknown: (set[str]) the unknown variable names seen so far
+    """
+
+    def __init__(self, index=None, max_unknown=2):
+
+        self.index = index
+        self.max_unknown = max_unknown
+        self.dag = IncrementalDAG()
+        self.unknown = set()
+
+    def __call__(self, line):
+        """
+        Args:
+            line: (str) a line of the answer
+
+        Returns:
+            (str / None) the reason to abort, None to continue
+        """
+
+        try:
+            edge = parse_edge(line)
+        except ValueError as e:
+            return str(e)
+        if edge is None:
+            return None
+        if self.index is not None:
+            matched = [self.index.match(node) for node in edge]
+            self.unknown.update(node for node, match in zip(edge, matched) if match is None)
+            if len(self.unknown) > self.max_unknown:
+                return "unknown variables: {}".format(", ".join(sorted(self.unknown)))
+            if None in matched:
+                return None
+            edge = tuple(matched)
+        if not self.dag.add_edge(*edge):
+            return f"{edge[0]} -> {edge[1]} creates a cycle"
+
+        return None
+
 def restructure_gpt_response(response):
     """
     restructures the GPT response so that it can be readily converted into a causal graph
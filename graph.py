@@ -3,6 +3,92 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 import numpy as np
+from compact_graph import CompactGraph
+from profiling import traced
+
+class IncrementalDAG:
+    """
+    DAG that is built one edge at a time and rejects the edges that would create a cycle. A topological
+    order of the nodes is maintained (Pearce-Kelly), so only the nodes between the endpoints of an edge
+    that violates the order are searched.
+
+    Attributes:
+        children: (dict) maps each node to the set of its children
+        parents: (dict) maps each node to the set of its parents
+        order: (dict) maps each node to its position in the topological order
+    """
+
+    def __init__(self):
+
+        self.children = {}
+        self.parents = {}
+        self.order = {}
+
+    def add_node(self, node):
+        """
+        adds the node at the end of the topological order
+        """
+
+        if node not in self.order:
+            self.order[node] = len(self.order)
+            self.children[node] = set()
+            self.parents[node] = set()
+
+    def search(self, start, neighbours, keep):
+        """
+        Depth-first search from start, restricted to the nodes for which keep(node) is True
+
+        Args:
+            start: (str) the first node
+            neighbours: (dict) the children / parents of each node
+            keep: (callable) whether a node can be visited
+
+        Returns:
+            (set) the visited nodes
+        """
+
+        visited = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for nxt in neighbours[node]:
+                if nxt not in visited and keep(nxt):
+                    visited.add(nxt)
+                    stack.append(nxt)
+
+        return visited
+
+    def add_edge(self, u, v):
+        """
+        Adds the edge u -> v unless it creates a cycle
+
+        Args:
+            u: (str) the parent
+            v: (str) the child
+
+        Returns:
+            (bool) False if the edge would create a cycle (the edge is not added)
+        """
+
+        self.add_node(u)
+        self.add_node(v)
+        if u == v:
+            return False
+        lower, upper = self.order[v], self.order[u]
+        if lower < upper:
+            forward = self.search(v, self.children, lambda n: self.order[n] <= upper)
+            if u in forward:
+                return False
+            backward = self.search(u, self.parents, lambda n: self.order[n] >= lower)
+            moved = sorted(backward, key=self.order.get) + sorted(forward, key=self.order.get)
+            positions = sorted(self.order[n] for n in moved)
+            for node, position in zip(moved, positions):
+                self.order[node] = position
+        self.children[u].add(v)
+        self.parents[v].add(u)
+
+        return True
+
 
 class CausalGraph:
     """
@@ -18,7 +104,7 @@ class CausalGraph:
         self.edge_list = edge_list
         self.unobserved_vars = unobserved_vars
         self.unobserved_edges = unobserved_edges
-        self.graph = nx.DiGraph()
+        self._graph = None
         self.update_graph()
         self.data = data
 
@@ -44,33 +130,48 @@ class CausalGraph:
 
     def update_graph(self):
         """
-        updates the nodes and edges of the graph
+        updates the nodes and edges of the graph. Only the compact representation is built; the networkx
+        graph is built again from it when it is needed (see graph)
+        """
+
+        self.compact = CompactGraph.from_edges(self.treat_var, self.outcome_var, self.other_vars, self.edge_list,
+                                               self.unobserved_vars, self.unobserved_edges)
+        self._graph = None
+
+    @property
+    def graph(self):
+        """
+        The networkx graph, built on first use (plotting, synthetic data). The nodes have observed / treatment /
+        outcome attributes and the edges have an observed attribute
+
+        Returns:
+            (nx.DiGraph)
         """
 
-        self.graph.add_node(self.treat_var, observed=True, treatment=True, outcome=False)
-        self.graph.add_node(self.outcome_var, observed=True, treatment=False, outcome=True)
-        for node in self.other_vars:
-            self.graph.add_node(node, observed=True, treatment=False, outcome=False)
-        self.graph.add_edges_from([(u, v, {'observed': True}) for u, v in self.edge_list ])
+        if self._graph is None:
+            self._graph = self.compact.to_networkx()
+
+        return self._graph
+
+    def edges(self):
+        """
+        Returns:
+            List[(str, str)]: every edge of the graph
+        """
 
-        if self.unobserved_vars is not None:
-            for node in self.unobserved_vars:
-                self.graph.add_node(node, observed=False, treatment=False, outcome=False)
-        if self.unobserved_edges is not None:
-            self.graph.add_edges_from([(u, v, {'observed': False}) for u, v in self.unobserved_edges])
+        return self.compact.edges()
 
     
+    @traced()
     def detect_cycles(self):
         """
         Detects if the graph contains a cycle
         """
 
-        try:
-            cycle = nx.find_cycle(self.graph)
-            return True 
-        except nx.exception.NetworkXNoCycle:
-            print("No cycles in the graph")
-            return False 
+        if self.compact.has_cycle():
+            return True
+        print("No cycles in the graph")
+        return False
     
     def plot_graph(self, save_loc="figures/causal_graphs", name="sample_graph.pdf"):
         """
@@ -139,11 +240,13 @@ class CausalGraph:
             List[(str, str)]: the undirected edges (aka confounder)
 
         """
-        ## both observed and unobserved
-        nodes = [node for node, attr in self.graph.nodes(data=True) if attr['observed']]
-        observed_edges = [(u, v) for u, v, attr in self.graph.edges(data=True) if attr['observed']]
-        unobserved_edges = [(u, v) for u, v, attr in self.graph.edges(data=True) if not attr['observed']]
 
-        return nodes, observed_edges, unobserved_edges
+        return self.compact.to_ananke()
 
+    def to_dot(self):
+        """
+        Returns:
+            (str) the graph in DOT format, compatible with dowhy (same output as util.format_graph_DOT)
+        """
 
+        return self.compact.to_dot()
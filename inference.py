@@ -1,5 +1,9 @@
 import dowhy
-from util import format_graph_DOT
+from dataprep import required_columns, compact_frame
+from nuisance import NUISANCE_METHODS, estimate_with_nuisance
+from approximate import APPROXIMATE_METHODS, approximate_effect
+from cate import CATEEstimator
+from profiling import traced, span
 from ananke import graphs
 from ananke import identification
 import matplotlib.pyplot as plt
@@ -99,18 +103,37 @@ class Inference:
 class DowhyInference(Inference):
     """
     performs inference using the DoWhy package
+    Attributes:
+        compact_data: (bool) whether the estimators only get the columns required by the estimand, downcast
+        data_report: (dict / None) the columns and memory before / after compacting the data
     """
 
-    def __init__(self, causal_graph, data):
+    def __init__(self, causal_graph, data, compact_data=True):
 
         super().__init__(causal_graph, data)
-        self.model = dowhy.CausalModel(data=data, treatment=self.treat_var, outcome=self.outcome_var,
-                                       graph=format_graph_DOT(self.causal_graph.graph))
+        self.compact_data = compact_data
+        self.data_report = None
+        self.model = self.build_model(data)
 
         #self.model.view_model(layout="dot")  # This generates the graph
         #im_graph.draw("graph_plots/dowhy_model.png", prog="dot")
 
 
+    def build_model(self, data):
+        """
+        Builds the DoWhy model of the causal graph on the data
+
+        Args:
+            data: (pd.DataFrame)
+
+        Returns:
+            (dowhy.CausalModel)
+        """
+
+        return dowhy.CausalModel(data=data, treatment=self.treat_var, outcome=self.outcome_var,
+                                 graph=self.causal_graph.to_dot())
+
+    @traced("DowhyInference.identification")
     def identification(self, print_=True):
         """
         Performs identification using DoWhy
@@ -123,6 +146,28 @@ class DowhyInference(Inference):
         ## ToDo: Updates with instrumental variables
         self.identifiable = (len(self.estimand.get_backdoor_variables()) != 0 or
                              len(self.estimand.get_frontdoor_variables()) != 0)
+        if self.compact_data:
+            self.prepare_data()
+
+    @traced("DowhyInference.prepare_data")
+    def prepare_data(self):
+        """
+        Restricts the data used for estimation to the treatment, the outcome, the variables of the estimand and
+        the effect modifiers of the model, downcast to the smallest lossless dtype
+        """
+
+        ## DoWhy's estimators add its effect modifiers to the regressions whenever they are in the data, so
+        ## they are kept to get the same estimates as on the full data
+        columns = required_columns(self.treat_var, self.outcome_var, self.estimand,
+                                   self.model.get_effect_modifiers())
+        columns = [col for col in columns if col in self.data.columns]
+        self.data, self.data_report = compact_frame(self.data, columns, keep_dtype=[self.treat_var])
+        ## the estimators are fitted on the data of the model. The estimand identified on the full data is
+        ## reused with the model built on the compact data
+        self.model = self.build_model(self.data)
+        print("Estimation data: {} -> {} columns, {:.1f} KB saved".format(
+            self.data_report["columns_before"], self.data_report["columns_after"],
+            self.data_report["bytes_saved"] / 1024))
 
     def estimation(self, adjustments=["backdoor", "frontdoor", "iv"], 
                   method_back="linear_regression", method_front="linear_regression",
@@ -149,11 +194,16 @@ class DowhyInference(Inference):
         return estimates
 
 
-    def backdoor_estimation(self, method="propensity_score_weighting"):
+    @traced("DowhyInference.backdoor_estimation")
+    def backdoor_estimation(self, method="propensity_score_weighting", learner="linear", n_folds=5, n_jobs=-1):
         """
         Estimates the causal effect using backdoor criterion
         Args:
-            method: (str)
+            method: (str) a DoWhy backdoor method, or one of nuisance.NUISANCE_METHODS (ipw,
+                    regression_adjustment, aipw, dml), which share cross-fitted nuisance models
+            learner: (str) the nuisance learner (see nuisance.LEARNERS)
+            n_folds: (int) number of cross-fitting folds of the nuisance models
+            n_jobs: (int) number of folds fitted in parallel
         Returns:
             (float / None)
         """
@@ -162,6 +212,9 @@ class DowhyInference(Inference):
 
         if len(self.estimand.get_backdoor_variables()) != 0:
             try:
+                if method in NUISANCE_METHODS:
+                    return estimate_with_nuisance(method, self.data, self.treat_var, self.outcome_var,
+                                                  self.estimand.get_backdoor_variables(), learner, n_folds, n_jobs)
                 ate = self.model.estimate_effect(self.estimand, method_name=method_name)
                 #refuter = self.model.refute_estimate(self.estimand, ate, 
                 #                                     method_name=self.refute_method) 
@@ -174,6 +227,70 @@ class DowhyInference(Inference):
         else:
             return None
 
+    @traced("DowhyInference.approximate_backdoor_estimation")
+    def approximate_backdoor_estimation(self, width, method="linear_regression", confidence=0.95, exact=False,
+                                        **options):
+        """
+        Estimates the causal effect using backdoor criterion on growing subsamples of the data, until the
+        confidence interval is narrower than width (see approximate.approximate_effect)
+        Args:
+            width: (float) the requested width of the confidence interval
+            method: (str) linear_regression / aipw / dml. The other backdoor methods use the exact estimation
+            confidence: (float) the confidence level
+            exact: (bool) whether to use the exact estimation on the full data instead
+            options: other arguments of approximate.approximate_effect
+        Returns:
+            (dict / None) the estimate, the error bound and the fraction of the data used
+        """
+
+        if len(self.estimand.get_backdoor_variables()) == 0:
+            return None
+        if not exact and method not in APPROXIMATE_METHODS:
+            print(f"{method} is not supported by the approximate estimation. Using the exact estimation")
+            exact = True
+        if exact:
+            return {"estimate": self.backdoor_estimation(method, n_jobs=options.get("n_jobs", -1)),
+                    "error_bound": None, "fraction": 1.0, "rows": len(self.data), "exact": True}
+        ## DoWhy's linear regression interacts the treatment with the effect modifiers that are in the data
+        modifiers = [col for col in self.model.get_effect_modifiers() if col in self.data.columns]
+        try:
+            return approximate_effect(self.data, self.treat_var, self.outcome_var,
+                                      self.estimand.get_backdoor_variables(), width, method, confidence,
+                                      effect_modifiers=modifiers, **options)
+        except Exception as e:
+            print("Got the following error: {}".format(e))
+
+    @traced("DowhyInference.cate_estimation")
+    def cate_estimation(self, learner="x", base="forest"):
+        """
+        Fits a meta-learner of the conditional treatment effects on the backdoor adjustment set
+        Args:
+            learner: (str) s / t / x
+            base: (str) the base learner (see nuisance.LEARNERS)
+        Returns:
+            (CATEEstimator) the fitted estimator
+        """
+
+        return CATEEstimator(self, learner, base).fit()
+
+    def nuisance_estimation(self, methods=NUISANCE_METHODS, learner="linear", n_folds=5, n_jobs=-1):
+        """
+        Estimates the causal effect with every nuisance-based backdoor method. The nuisance models are
+        fitted once and shared by all the methods
+
+        Args:
+            methods: (List[str]) the methods (see nuisance.NUISANCE_METHODS)
+            learner: (str) the nuisance learner (see nuisance.LEARNERS)
+            n_folds: (int) number of cross-fitting folds
+            n_jobs: (int) number of folds fitted in parallel
+
+        Returns:
+            (dict) the estimate of each method
+        """
+
+        return {method: self.backdoor_estimation(method, learner, n_folds, n_jobs) for method in methods}
+
+    @traced("DowhyInference.frontdoor_estimation")
     def frontdoor_estimation(self, method="linear_regression"):
         """
         Estimates the causal effect using frontdoor criterion
@@ -202,6 +319,7 @@ class DowhyInference(Inference):
 
     ## ToDo: Add instrumental variable estimation
 
+    @traced("DowhyInference.iv_estimation")
     def iv_estimation(self):
         """
         Estimates the causal effect using instrumental variable"
@@ -240,10 +358,15 @@ class AnankeInference(Inference):
         bi_edges = [(self.causal_graph.get_treatment_var(), self.causal_graph.get_outcome_var())]
 
         self.model = graphs.ADMG(vertices, di_edges=di_edges, bi_edges=bi_edges)
+        ## Ananke fits on every observed vertex. The values are kept as they are since the SEM fit does
+        ## matrix products on the raw arrays
+        self.data, self.data_report = compact_frame(self.data, [v for v in vertices if v in self.data.columns],
+                                                    downcast_columns=False)
         g_draw = self.model.draw()
         g_draw.render(filename='my_graph', directory="graph_plots", cleanup=False)
 
 
+    @traced("AnankeInference.identification")
     def identification(self, print_=False):
 
         one_line_id = identification.OneLineID(graph=self.model,
@@ -252,6 +375,7 @@ class AnankeInference(Inference):
         if self.identifiable:
             print("Identification works. The functinal form is: {}".format(one_line_id.functional()))
 
+    @traced("AnankeInference.estimation")
     def estimation(self, method="eff-aipw"):
         """
         performs treatment effect estimation using Arid graphs + SEMs
@@ -268,7 +392,8 @@ class AnankeInference(Inference):
             g_arid_draw = g_arid.draw(direction="LR")
             g_arid_draw.render(filename='my_arid_graph', directory="graph_plots", cleanup=False)
             self.model = LinearGaussianSEM(g_arid)
-            self.model.fit(self.data)
+            with span("LinearGaussianSEM.fit"):
+                self.model.fit(self.data)
             model_draw = self.model.draw(direction="LR")
             model_draw.render(filename='model_arid_graph', directory="graph_plots", cleanup=False)
             ate["sem"] = self.model.total_effect([self.treat_var], [self.outcome_var])
@@ -276,13 +401,13 @@ class AnankeInference(Inference):
         else:
             causal_effect = CausalEffect(graph=self.model, treatment=self.treat_var,
                                          outcome=self.outcome_var)
-            print(self.data)
-            print(method)
-            ate["front/backdoor"] = causal_effect.compute_effect(self.data, method)
+            with span("CausalEffect.compute_effect", method=method):
+                ate["front/backdoor"] = causal_effect.compute_effect(self.data, method)
 
         return ate
 
 
+@traced()
 def infer_causal_effect(graph, data=None, method="linear_regression"):
     """
     Infers the causal effect associated with the graph
@@ -0,0 +1,91 @@
+## this checks the conditional treatment effect learners on the IHDP datasets found in QRdata. The graph is the
+## known IHDP structure (every covariate confounds treatment and outcome), so no GPT call is needed.
+## The IHDP simulation (Hill, 2011, response surface B) shifts the treated outcomes so that the average effect on
+## the treated is 4 in every replication. The average of the estimated effects over the treated rows is checked
+## against it. The ATE differs between replications; it is only checked if a json file with the answers is given.
+
+
+import os 
+import pandas as pd
+from pathlib import Path
+import json
+import argparse
+import sys 
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from graph import CausalGraph
+from inference import DowhyInference
+
+## the average treatment effect on the treated of every IHDP replication
+IHDP_ATT = 4.0
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", help="folder containing the data")
+    parser.add_argument("--json_filepath", help="json file with the true ATE of each dataset (optional)",
+                        default=None)
+    parser.add_argument("--output_folder", help="location where output is saved")
+    parser.add_argument("--learners", help="meta-learners to check", nargs="+", default=["s", "t", "x"])
+    parser.add_argument("--base", help="base learner of the meta-learners", default="forest")
+    parser.add_argument("--segment", help="column over which the effects are aggregated", default="x7")
+    parser.add_argument("--chunk_size", help="number of rows scored at once", type=int, default=100000)
+
+    return parser.parse_args()
+
+
+def ihdp_graph(data):
+    """
+    builds the IHDP graph: treatment -> y, and every covariate -> treatment, y
+
+    Args:
+        data: (pd.DataFrame)
+
+    Returns:
+        (CausalGraph)
+    """
+
+    covariates = [col for col in data.columns if col not in ["treatment", "y"]]
+    edges = [("treatment", "y")] + [(x, "treatment") for x in covariates] + [(x, "y") for x in covariates]
+
+    return CausalGraph("treatment", "y", covariates, edges, data)
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    output_folder = Path(args.output_folder)
+    output_folder.mkdir(exist_ok=True, parents=True)
+
+    truth = {}
+    if args.json_filepath is not None:
+        with open(args.json_filepath, "r") as f:
+            truth = {q["data_files"][0]: float(q["answer"]) for q in json.load(f)}
+
+    result_dict = {"data_name": [], "learner": [], "true_att": [], "predicted_att": [], "att_error": [],
+                   "true_ate": [], "predicted_ate": [], "ate_error": []}
+    for path in sorted(Path(args.data_folder).glob("ihdp_*.csv")):
+        data = pd.read_csv(path)
+        treated = data[data["treatment"] == 1]
+        infer = DowhyInference(ihdp_graph(data), data)
+        infer.identification(False)
+        for learner in args.learners:
+            cate = infer.cate_estimation(learner, args.base)
+            att = cate.average_effect(treated, args.chunk_size)
+            ate = cate.average_effect(data, args.chunk_size)
+            true = truth.get(path.name)
+            result_dict["data_name"].append(path.name)
+            result_dict["learner"].append(learner)
+            result_dict["true_att"].append(IHDP_ATT)
+            result_dict["predicted_att"].append(att)
+            result_dict["att_error"].append(abs(att - IHDP_ATT))
+            result_dict["true_ate"].append(true)
+            result_dict["predicted_ate"].append(ate)
+            result_dict["ate_error"].append(abs(ate - true) if true is not None else None)
+            print("{} {}-learner: ATT true:{}, predicted:{}; ATE true:{}, predicted:{}".format(
+                path.name, learner, IHDP_ATT, att, true, ate))
+            print(cate.segment_effects(data, args.segment, args.chunk_size))
+
+    df = pd.DataFrame(result_dict)
+    df.to_csv(output_folder / "ihdp_cate.csv")
+    print(df.groupby("learner")[["att_error", "ate_error"]].mean())
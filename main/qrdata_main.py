@@ -11,7 +11,9 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from query import CausalQuery 
-from inference import DowhyInference
+from pipeline import PipelineScheduler, estimate_graph
+from profiling import enable_profiling
+from approximate import APPROXIMATE_METHODS
 
 def parse_arguments():
 
@@ -23,51 +25,104 @@ def parse_arguments():
     parser.add_argument("--output_folder", help="location where output is saved")
     parser.add_argument("--method", help="what method to use for estimation",
                         default="linear_regression")
-
-    return parser.parse_args()
+    parser.add_argument("--tiered", action="store_true",
+                        help="answer cheap prompts with heuristics / a small model before using the large model")
+    parser.add_argument("--discovery", choices=["seed", "replace"], default=None,
+                        help="learn the candidate edges (seed) or the whole graph (replace) from the data")
+    parser.add_argument("--stream_edges", action="store_true",
+                        help="stream the edge answer and abort it early when it contains a cycle / unknown variables")
+    parser.add_argument("--discovery_jobs", help="number of threads for the independence tests",
+                        type=int, default=1)
+    parser.add_argument("--approx_width", type=float, default=None,
+                        help="estimate the backdoor effect on subsamples until the confidence interval is this narrow")
+    parser.add_argument("--profile", default=None,
+                        help="write a Chrome trace of the run to this .json file / folder")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="overlap the elicitation of the next datasets with the estimation of the current ones")
+    parser.add_argument("--elicit_workers", help="number of datasets elicited concurrently (with --pipeline)",
+                        type=int, default=4)
+    parser.add_argument("--estimate_workers", help="number of estimation processes (with --pipeline)",
+                        type=int, default=None)
+
+    args = parser.parse_args()
+    if args.approx_width is not None and args.method not in APPROXIMATE_METHODS:
+        parser.error(f"--approx_width requires --method to be one of {APPROXIMATE_METHODS}")
+
+    return args
+
+
+def elicit(index, q, args, usages):
+    """
+    builds the causal graph of the dataset by querying GPT
+
+    Args:
+        index: (int) position of the entry in the json file
+        q: (dict) the entry of the json file
+        args: the command line arguments
+        usages: (dict) the GPT usage of the query is stored under the index of the entry (several entries
+                can share a data file and be elicited concurrently)
+
+    Returns:
+        (tuple / None) the arguments of pipeline.estimate_graph, None if the GPT answers are invalid
+    """
+
+    print("Testing data: {}".format(q["data_files"]))
+    data = pd.read_csv(Path(args.data_folder) / q["data_files"][0])
+    info = q['data_description']
+    query = args.query if len(args.query) != 0 else q["question"]
+    try:
+        cq = CausalQuery(query, data=data, additional_info=info, tiered=args.tiered,
+                         discovery=args.discovery, discovery_options={"n_jobs": args.discovery_jobs},
+                         stream_edges=args.stream_edges)
+    except ValueError as e:
+        print("Skipping {}: {}".format(q["data_files"][0], e))
+        return None
+    usages[index] = cq.get_usage()
+
+    return cq.get_graph(), data, q.get("method", args.method), args.approx_width
 
 if __name__ == "__main__":
 
     args = parse_arguments()
+    if args.profile is not None:
+        enable_profiling(args.profile)
     output_folder = Path(args.output_folder)
     output_graphs = output_folder / "graphs"
     output_folder.mkdir(exist_ok=True, parents=True)
     output_graphs.mkdir(exist_ok=True, parents=True)
 
-    result_dict = {"data_name":[], "true":[], "predicted_backdoor":[],
-                   "predicted_frontdoor":[]}
+    columns = ["data_name", "true", "predicted_backdoor", "predicted_frontdoor", "llm_latency", "llm_tokens",
+               "tokens_avoided"]
+    ## rows are kept with the index of their json entry, since the pipeline records them in completion order
+    rows = []
 
     with open(args.json_filepath, "r") as f:
         json_info = json.load(f)
-    query = args.query
-
-    count = 0
-    for q in json_info:
-        print("Testing data: {}".format(q["data_files"]))
-        data = pd.read_csv(Path(args.data_folder) / q["data_files"][0])
-        info = q['data_description']
-        if len(query) != 0:
-            cq = CausalQuery(query, data=data, additional_info=info)
-        else:
-            cq = CausalQuery(q["question"], data=data, additional_info=info)
-        graph = cq.get_graph()
-        infer = DowhyInference(graph, data)
-        infer.identification()
-
-        if "method" in q:
-            estim = infer.backdoor_estimation(q["method"])
-        else:
-            estim = infer.backdoor_estimation(args.method)
-
-        frontdoor_estim = infer.frontdoor_estimation()
-
-
-        result_dict['data_name'].append(q["data_files"][0])
-        result_dict['true'].append(float(q['answer']))
-        result_dict['predicted_backdoor'].append(estim)
-        result_dict["predicted_frontdoor"].append(frontdoor_estim)
+    usages = {}
+
+    def record(task, elicited, estimate):
+        index, q = task
+        if elicited is None:
+            return
+        estim, frontdoor_estim = estimate if estimate is not None else (None, None)
+        usage = usages[index]
+        tiers = ["heuristic", "cheap", "expensive"]
+        rows.append((index, [q["data_files"][0], float(q['answer']), estim, frontdoor_estim,
+                             sum(usage[t]["latency"] for t in tiers),
+                             sum(usage[t]["prompt_tokens"] + usage[t]["completion_tokens"] for t in tiers),
+                             usage["expensive_tokens_avoided"]]))
         print("true:{}, predicted:{}, frontdoor: {}".format(q['answer'], estim, frontdoor_estim))
         print('xxxxxxxxxxxxxxxxxxxxxx')
 
-    df = pd.DataFrame(result_dict)
+    tasks = list(enumerate(json_info))
+    if args.pipeline:
+        scheduler = PipelineScheduler(args.elicit_workers, args.estimate_workers)
+        scheduler.run(tasks, lambda task: elicit(*task, args, usages), estimate_graph, record)
+        print(scheduler.utilization_report())
+    else:
+        for task in tasks:
+            elicited = elicit(*task, args, usages)
+            record(task, elicited, estimate_graph(*elicited) if elicited is not None else None)
+
+    df = pd.DataFrame([row for _, row in sorted(rows, key=lambda item: item[0])], columns=columns)
     df.to_csv(output_folder/"{}.csv".format(args.data_name))
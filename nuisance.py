@@ -0,0 +1,212 @@
+## This file contains the nuisance models (propensity and outcome regressions) shared by the IPW, regression
+## adjustment, AIPW and double machine learning estimators. The models are cross-fitted once per
+## (data, adjustment set, learner) and their out-of-fold predictions are cached.
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.ensemble import (RandomForestClassifier, RandomForestRegressor, GradientBoostingClassifier,
+                              GradientBoostingRegressor)
+from profiling import traced
+
+## (propensity model, outcome model) of each learner
+LEARNERS = {"linear": (LogisticRegression(max_iter=1000), LinearRegression()),
+            "forest": (RandomForestClassifier(n_estimators=200, min_samples_leaf=5, random_state=0),
+                       RandomForestRegressor(n_estimators=200, min_samples_leaf=5, random_state=0)),
+            "boosting": (GradientBoostingClassifier(random_state=0), GradientBoostingRegressor(random_state=0))}
+NUISANCE_METHODS = ["ipw", "regression_adjustment", "aipw", "dml"]
+
+
+def data_key(*arrays):
+    """
+    Hashes the content of the arrays
+
+    Returns:
+        (str)
+    """
+
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(array.view(np.uint8))
+
+    return digest.hexdigest()
+
+
+def fit_fold(classifier, regressor, X, t, y, train, test):
+    """
+    Fits the nuisance models on the training fold and predicts them on the test fold
+
+    Args:
+        classifier: the propensity model
+        regressor: the outcome model
+        X: (np.ndarray) the adjustment variables
+        t: (np.ndarray) the binary treatment
+        y: (np.ndarray) the outcome
+        train: (np.ndarray) indices of the training fold
+        test: (np.ndarray) indices of the test fold
+
+    Returns:
+        (np.ndarray) the test indices
+        (dict) the predictions on the test fold: propensity (m), outcome under control (g0) / treatment (g1),
+               and outcome without conditioning on the treatment (l)
+    """
+
+    treated = train[t[train] == 1]
+    control = train[t[train] == 0]
+    predictions = {"m": clone(classifier).fit(X[train], t[train]).predict_proba(X[test])[:, 1],
+                   "g0": clone(regressor).fit(X[control], y[control]).predict(X[test]),
+                   "g1": clone(regressor).fit(X[treated], y[treated]).predict(X[test]),
+                   "l": clone(regressor).fit(X[train], y[train]).predict(X[test])}
+
+    return test, predictions
+
+
+class NuisanceCache:
+    """
+    Cache of cross-fitted nuisance predictions, keyed by the data, the learner and the folds. At most max_size
+    fits are kept; the least recently used one is evicted first (service.LRUCache is not reused since the
+    service imports this module)
+
+    Attributes:
+        max_size: (int) the largest number of cached fits
+        cache: (OrderedDict) the cached predictions, from the least to the most recently used
+    """
+
+    def __init__(self, max_size=32):
+
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @traced("NuisanceCache.get")
+    def get(self, X, t, y, learner="linear", n_folds=5, n_jobs=-1, seed=0):
+        """
+        Returns the out-of-fold nuisance predictions, fitting them (one fold per job) if they are not cached
+
+        Args:
+            X: (np.ndarray) the adjustment variables
+            t: (np.ndarray) the binary treatment
+            y: (np.ndarray) the outcome
+            learner: (str) one of LEARNERS
+            n_folds: (int) number of cross-fitting folds
+            n_jobs: (int) number of folds fitted in parallel (-1: all cores)
+            seed: (int) seed of the fold split
+
+        Returns:
+            (dict) the predictions m, g0, g1 and l for every row
+        """
+
+        if learner not in LEARNERS:
+            raise ValueError(f"{learner} is not a valid learner")
+        key = (data_key(X, t, y), learner, n_folds, seed)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        classifier, regressor = LEARNERS[learner]
+        folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed).split(X, t)
+        results = Parallel(n_jobs=n_jobs)(delayed(fit_fold)(classifier, regressor, X, t, y, train, test)
+                                          for train, test in folds)
+        nuisance = {name: np.empty(len(y)) for name in ["m", "g0", "g1", "l"]}
+        for test, predictions in results:
+            for name, values in predictions.items():
+                nuisance[name][test] = values
+        with self.lock:
+            self.cache[key] = nuisance
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+        return nuisance
+
+
+## shared by every estimator, so trying several methods on the same adjustment set fits the models once
+NUISANCE_CACHE = NuisanceCache()
+
+
+def aipw_scores(nuisance, t, y, clip=0.01):
+    """
+    Computes the efficient influence function scores of the ATE (their mean is the AIPW estimate)
+
+    Args:
+        nuisance: (dict) the nuisance predictions
+        t: (np.ndarray) the binary treatment
+        y: (np.ndarray) the outcome
+        clip: (float) propensities are clipped to [clip, 1 - clip]
+
+    Returns:
+        (np.ndarray)
+    """
+
+    m = np.clip(nuisance["m"], clip, 1 - clip)
+    g0, g1 = nuisance["g0"], nuisance["g1"]
+
+    return g1 - g0 + t * (y - g1) / m - (1 - t) * (y - g0) / (1 - m)
+
+
+def nuisance_estimate(method, nuisance, t, y, clip=0.01):
+    """
+    Estimates the ATE from the nuisance predictions
+
+    Args:
+        method: (str) ipw / regression_adjustment / aipw / dml
+        nuisance: (dict) the nuisance predictions
+        t: (np.ndarray) the binary treatment
+        y: (np.ndarray) the outcome
+        clip: (float) propensities are clipped to [clip, 1 - clip]
+
+    Returns:
+        (float)
+    """
+
+    if method == "ipw":
+        m = np.clip(nuisance["m"], clip, 1 - clip)
+        return float(np.mean(t * y / m - (1 - t) * y / (1 - m)))
+    elif method == "regression_adjustment":
+        return float(np.mean(nuisance["g1"] - nuisance["g0"]))
+    elif method == "aipw":
+        return float(np.mean(aipw_scores(nuisance, t, y, clip)))
+    elif method == "dml":
+        ## partially linear model: regress the outcome residual on the treatment residual
+        t_res = t - nuisance["m"]
+        y_res = y - nuisance["l"]
+        return float(np.sum(t_res * y_res) / np.sum(t_res ** 2))
+    else:
+        raise ValueError(f"{method} is not a valid nuisance-based method")
+
+
+def estimate_with_nuisance(method, data, treat_var, outcome_var, adjustment, learner="linear", n_folds=5,
+                           n_jobs=-1, cache=NUISANCE_CACHE):
+    """
+    Estimates the ATE with a nuisance-based estimator
+
+    Args:
+        method: (str) ipw / regression_adjustment / aipw / dml
+        data: (pd.DataFrame) the data
+        treat_var: (str) the binary treatment variable
+        outcome_var: (str) the outcome variable
+        adjustment: (List[str]) the adjustment set
+        learner: (str) one of LEARNERS
+        n_folds: (int) number of cross-fitting folds
+        n_jobs: (int) number of folds fitted in parallel
+        cache: (NuisanceCache) where the nuisance predictions are cached
+
+    Returns:
+        (float)
+    """
+
+    X = data[list(adjustment)].to_numpy(dtype=float)
+    t = data[treat_var].to_numpy(dtype=float)
+    y = data[outcome_var].to_numpy(dtype=float)
+    if not np.isin(t, [0, 1]).all():
+        raise ValueError(f"{method} requires a binary treatment")
+    nuisance = cache.get(X, t, y, learner, n_folds, n_jobs)
+
+    return nuisance_estimate(method, nuisance, t, y)
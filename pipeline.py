@@ -0,0 +1,195 @@
+## This file defines a scheduler that overlaps the GPT elicitation (network-bound) of some datasets with the
+## estimation (CPU-bound) of others
+
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from inference import DowhyInference
+
+_DONE = object()
+
+
+def estimate_graph(graph, data, method, approx_width=None):
+    """
+    Identifies and estimates the treatment effect of the graph (runs in a worker process). The nuisance models
+    are fitted in the worker itself, since every worker process already uses one core
+
+    Args:
+        graph: (CausalGraph)
+        data: (pd.DataFrame)
+        method: (str) the backdoor estimation method
+        approx_width: (float / None) if given, the backdoor effect is estimated on subsamples until the
+                      confidence interval is narrower than approx_width
+
+    Returns:
+        (float / None) the backdoor estimate
+        (float / None) the frontdoor estimate
+    """
+
+    infer = DowhyInference(graph, data)
+    infer.identification()
+    if approx_width is not None:
+        approx = infer.approximate_backdoor_estimation(approx_width, method, n_jobs=1)
+        backdoor = approx["estimate"] if approx is not None else None
+    else:
+        backdoor = infer.backdoor_estimation(method, n_jobs=1)
+
+    return backdoor, infer.frontdoor_estimation()
+
+
+def _timed(func, args):
+    """
+    Calls func(*args) and measures its duration (used to measure the busy time of the worker processes)
+
+    Returns:
+        (object) the result of func
+        (float) the duration in seconds
+    """
+
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+class PipelineScheduler:
+    """
+    Producer / consumer pipeline with three stages: elicitation on a thread pool, estimation on a process pool,
+    and recording on the calling thread. The stages are connected by bounded queues, so elicitation waits when
+    estimation falls behind.
+
+    Attributes:
+        elicit_workers: (int) number of elicitation threads
+        estimate_workers: (int) number of estimation processes
+        queue_size: (int) capacity of the queue between elicitation and estimation
+        stats: (dict) busy time, blocked time and number of items of each stage
+    """
+
+    def __init__(self, elicit_workers=4, estimate_workers=None, queue_size=2):
+
+        self.elicit_workers = elicit_workers
+        self.estimate_workers = estimate_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.stats = {}
+        self.wall_time = 0.0
+        self.lock = threading.Lock()
+
+    def add_stat(self, stage, key, value):
+        """
+        adds the value to the statistic of the stage (thread-safe)
+        """
+
+        with self.lock:
+            self.stats[stage][key] += value
+
+    def run(self, tasks, elicit_fn, estimate_fn, record_fn):
+        """
+        Runs every task through the three stages
+
+        Args:
+            tasks: (List) the inputs of the elicitation stage
+            elicit_fn: (callable) maps a task to the arguments (tuple) of estimate_fn. Called on a thread
+            estimate_fn: (callable) module-level function that estimates the effect. Called in a worker process
+            record_fn: (callable) called with (task, elicited, estimate) on the calling thread. elicited / estimate
+                       is None if the stage failed
+        """
+
+        self.stats = {stage: {"busy": 0.0, "blocked": 0.0, "items": 0} for stage in ["elicit", "estimate", "record"]}
+        start = time.perf_counter()
+        inputs = queue.Queue()
+        elicited = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+        for task in tasks:
+            inputs.put(task)
+        for _ in range(self.elicit_workers):
+            inputs.put(_DONE)
+
+        def elicit_worker():
+            while True:
+                task = inputs.get()
+                if task is _DONE:
+                    elicited.put(_DONE)
+                    return
+                t0 = time.perf_counter()
+                try:
+                    args = elicit_fn(task)
+                except Exception as e:
+                    print("Elicitation failed: {}".format(e))
+                    args = None
+                t1 = time.perf_counter()
+                self.add_stat("elicit", "busy", t1 - t0)
+                self.add_stat("elicit", "items", 1)
+                if args is None:
+                    results.put((task, None, None))
+                else:
+                    elicited.put((task, args))
+                    self.add_stat("elicit", "blocked", time.perf_counter() - t1)
+
+        def dispatcher(executor):
+            ## at most estimate_workers estimations are submitted; the rest waits in the elicited queue
+            slots = threading.BoundedSemaphore(self.estimate_workers)
+            finished = 0
+            while finished < self.elicit_workers:
+                item = elicited.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                t0 = time.perf_counter()
+                slots.acquire()
+                self.add_stat("estimate", "blocked", time.perf_counter() - t0)
+                task, args = item
+                future = executor.submit(_timed, estimate_fn, args)
+                future.add_done_callback(lambda f: slots.release())
+                results.put((task, args, future))
+            results.put(_DONE)
+
+        ## the workers are spawned rather than forked: the elicitation threads may hold locks (OpenAI client,
+        ## stdout, tracemalloc) when the first estimation is submitted, and a forked child would inherit them
+        with ProcessPoolExecutor(max_workers=self.estimate_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            threads = [threading.Thread(target=elicit_worker, daemon=True) for _ in range(self.elicit_workers)]
+            threads.append(threading.Thread(target=dispatcher, args=(executor,), daemon=True))
+            for thread in threads:
+                thread.start()
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                task, args, future = item
+                estimate = None
+                if future is not None:
+                    if future.exception() is not None:
+                        print("Estimation failed: {}".format(future.exception()))
+                    else:
+                        estimate, duration = future.result()
+                        self.add_stat("estimate", "busy", duration)
+                    self.add_stat("estimate", "items", 1)
+                t0 = time.perf_counter()
+                record_fn(task, args, estimate)
+                self.add_stat("record", "busy", time.perf_counter() - t0)
+                self.add_stat("record", "items", 1)
+            for thread in threads:
+                thread.join()
+        self.wall_time = time.perf_counter() - start
+
+    def utilization_report(self):
+        """
+        Summarizes the utilization of each stage: busy time / (wall time x workers). The stage with the highest
+        utilization is the bottleneck. Blocked time is the time spent waiting on a full downstream stage.
+
+        Returns:
+            (str)
+        """
+
+        workers = {"elicit": self.elicit_workers, "estimate": self.estimate_workers, "record": 1}
+        lines = [f"wall time: {self.wall_time:.2f}s"]
+        for stage, info in self.stats.items():
+            utilization = info["busy"] / (self.wall_time * workers[stage]) if self.wall_time > 0 else 0.0
+            lines.append(f"{stage}: workers={workers[stage]}, items={info['items']}, busy={info['busy']:.2f}s, "
+                         f"blocked={info['blocked']:.2f}s, utilization={utilization:.0%}")
+
+        return "\n".join(lines)
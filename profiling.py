@@ -0,0 +1,192 @@
+## This file defines opt-in tracing spans. Each span records its wall time, CPU time and peak traced memory, and
+## the spans of a run are exported in the Chrome trace format (chrome://tracing, Perfetto, speedscope).
+## Profiling is off by default; enable it with enable_profiling() or the CAUSALCSS_PROFILE environment variable
+## (a .json file, or a folder in which one file per run is written).
+## tracemalloc is process wide, so the peak memory is only recorded for the spans during which no other thread had an
+## open span; the spans that overlap spans of other threads have no peak_kb.
+
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import tracemalloc
+from pathlib import Path
+
+_ENABLED = False
+_EVENTS = []
+_LOCAL = threading.local()
+_STATE = {"path": None, "start": 0, "memory": False, "registered": False}
+## number of open spans of each thread, and a counter that is incremented whenever spans of two threads overlap
+_THREADS = {"depth": {}, "overlaps": 0, "lock": threading.Lock()}
+
+
+def enable_profiling(path="profiles", trace_memory=True):
+    """
+    Enables the spans. The trace is written when the process exits (or by export_trace)
+
+    Args:
+        path: (str) the trace file (.json), or a folder in which a file named after the run is created
+        trace_memory: (bool) whether to record the peak memory of the spans (uses tracemalloc)
+    """
+    global _ENABLED
+
+    path = Path(path)
+    if path.suffix != ".json":
+        path = path / "trace_{}_{}.json".format(time.strftime("%Y%m%d_%H%M%S"), os.getpid())
+    _STATE.update(path=path, start=time.perf_counter_ns(), memory=trace_memory)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if not _STATE["registered"]:
+        atexit.register(export_trace)
+        _STATE["registered"] = True
+    _EVENTS.clear()
+    _ENABLED = True
+
+
+def disable_profiling():
+    """
+    Disables the spans (the recorded ones are kept until export_trace)
+    """
+    global _ENABLED
+
+    _ENABLED = False
+    if _STATE["memory"] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    """
+    Returns:
+        (bool)
+    """
+
+    return _ENABLED
+
+
+class span:
+    """
+    Context manager that records a span. It does nothing when profiling is disabled. The span has no peak_kb when
+    a span of another thread was open at the same time
+
+    Attributes:
+        name: (str) name of the span
+        args: (dict) extra information stored with the span
+    """
+
+    def __init__(self, name, **args):
+
+        self.name = name
+        self.args = args
+        self.active = False
+
+    def __enter__(self):
+
+        if not _ENABLED:
+            return self
+        self.active = True
+        stack = getattr(_LOCAL, "stack", None)
+        if stack is None:
+            stack = _LOCAL.stack = []
+        self.child_peak = 0
+        self.outer_peak = 0
+        tid = threading.get_ident()
+        with _THREADS["lock"]:
+            depth = _THREADS["depth"]
+            shared = any(other != tid for other in depth)
+            if shared:
+                _THREADS["overlaps"] += 1
+            depth[tid] = depth.get(tid, 0) + 1
+            self.overlaps = _THREADS["overlaps"]
+        ## resetting the peak while another thread is tracing would corrupt its spans
+        self.memory = _STATE["memory"] and tracemalloc.is_tracing() and not shared
+        if self.memory:
+            self.memory_start, self.outer_peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.cpu_start = time.thread_time_ns()
+        self.wall_start = time.perf_counter_ns()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+
+        if not self.active:
+            return False
+        wall_end = time.perf_counter_ns()
+        cpu = time.thread_time_ns() - self.cpu_start
+        args = dict(self.args, cpu_ms=cpu / 1e6)
+        stack = _LOCAL.stack
+        stack.pop()
+        with _THREADS["lock"]:
+            depth = _THREADS["depth"]
+            depth[threading.get_ident()] -= 1
+            if depth[threading.get_ident()] == 0:
+                del depth[threading.get_ident()]
+            shared = _THREADS["overlaps"] != self.overlaps
+        if self.memory and not shared and tracemalloc.is_tracing():
+            ## the peak was reset on entry, so the peak of the children is tracked separately
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            args["peak_kb"] = (peak - self.memory_start) / 1024
+            if len(stack) != 0:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak, self.outer_peak)
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        _EVENTS.append({"name": self.name, "cat": "causalcss", "ph": "X",
+                        "ts": (self.wall_start - _STATE["start"]) / 1e3, "dur": (wall_end - self.wall_start) / 1e3,
+                        "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+        return False
+
+
+def traced(name=None):
+    """
+    Decorator that records a span for every call of the function
+
+    Args:
+        name: (str / None) name of the span. Defaults to the qualified name of the function
+
+    Returns:
+        (callable)
+    """
+
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+            with span(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def export_trace(path=None):
+    """
+    Writes the recorded spans as a Chrome trace
+
+    Args:
+        path: (str / None) the output file. Defaults to the path given to enable_profiling
+
+    Returns:
+        (Path / None) the written file, None if nothing was recorded
+    """
+
+    path = Path(path) if path is not None else _STATE["path"]
+    if path is None or len(_EVENTS) == 0:
+        return None
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": list(_EVENTS), "displayTimeUnit": "ms"}, f)
+    print(f"Profiling trace written to {path}")
+
+    return path
+
+
+if os.getenv("CAUSALCSS_PROFILE"):
+    enable_profiling(os.getenv("CAUSALCSS_PROFILE"))
@@ -1,6 +1,17 @@
 ## This file contains classes / functions for representing prompts
-from gpt import interface_gpt
+from gpt import interface_gpt, stream_gpt, StreamingEdgeParser, DEFAULT_MODEL
+from validation import ColumnIndex
+from profiling import traced
+import re
 import sys 
+import time
+
+## column names that identify the treatment / outcome without asking a model (e.g. IHDP uses treatment and y)
+HEURISTIC_COLUMNS = {"treat": ["treatment", "treat", "treated", "t", "w"],
+                     "outcome": ["y", "outcome", "y_factual", "target"]}
+## prompts that are answered by the cheap tier. Every other prompt goes to the expensive model
+CHEAP_KEYS = ["query", "treat", "outcome"]
+CHEAP_MODEL = "gpt-4o-mini"
 
 def construct_prompt_0():
     """
@@ -45,6 +56,82 @@ def construct_prompt_1(query, data, additional_info):
 
     return query_prompt +  data_prompt + additional_prompt + closing
 
+def guess_column(data, candidates):
+    """
+    Finds the column of the data whose name matches one of the candidate names (case-insensitive)
+
+    Args:
+        data: (pd.DataFrame / None) the input data
+        candidates: (List[str]) the candidate names in order of preference
+
+    Returns:
+        (str / None) the matched column, None if there is no match
+    """
+
+    if data is None:
+        return None
+    lookup = {str(col).lower(): col for col in data.columns}
+    for name in candidates:
+        if name in lookup:
+            return lookup[name]
+
+    return None
+
+
+def mentioned_columns(text, columns):
+    """
+    Finds the columns whose name appears as a word in the text (case-insensitive)
+
+    Args:
+        text: (str) e.g. the query
+        columns: (List[str]) the column names
+
+    Returns:
+        (List[str])
+    """
+
+    text = text.lower()
+
+    return [col for col in columns
+            if re.search(r"(?<![\w'])" + re.escape(str(col).lower()) + r"(?![\w'])", text) is not None]
+
+
+def is_consistent_guess(guess, query, additional_info, columns):
+    """
+    Checks that a column guessed from its name agrees with the query. If the query names columns of the data,
+    the guess must be one of them. Otherwise the guess must be named in the query or the additional information.
+
+    Args:
+        guess: (str) the guessed column
+        query: (str) the causal query
+        additional_info: (str) the description of the data
+        columns: (List[str]) the columns of the data
+
+    Returns:
+        (bool)
+    """
+
+    in_query = mentioned_columns(query, columns)
+    if len(in_query) != 0:
+        return guess in in_query
+
+    return len(mentioned_columns(additional_info, [guess])) != 0
+
+
+def estimate_tokens(messages):
+    """
+    Roughly estimates the number of tokens in a list of messages (~4 characters per token)
+
+    Args:
+        messages: (List[dict]) the messages
+
+    Returns:
+        (int)
+    """
+
+    return sum(len(str(m["content"])) for m in messages) // 4
+
+
 def ask_treatment(data, other_info=""):
     """
     Creates the prompt that asks about the treatment variable
@@ -116,6 +203,28 @@ def ask_edges():
 
 
 
+def ask_orient_edges(directed, undirected):
+    """
+    Creates the prompt that asks to orient and prune the edges found by structure discovery
+
+    Args:
+        directed: (List[(str, str)]) edges whose direction was found from the data
+        undirected: (List[(str, str)]) edges whose direction is unknown
+
+    Returns:
+        (str)
+    """
+
+    candidates = [f"{u} -> {v}" for u, v in directed] + [f"{u} -- {v}" for u, v in undirected]
+    prompt = ("Structure learning on the data found the following candidate edges. "
+              "'A -> B' is an oriented edge and 'A -- B' is an edge with unknown direction:\n{}\n"
+              "Give a direction to every edge, remove the implausible edges and keep the rest. Only use these edges. "
+              "\nWrite output in the format node1 -> node2. Include one set of edge in one line. Avoid cycles. "
+              .format("\n".join(candidates)))
+
+    return prompt
+
+
 class CausalPrompt:
 
     """
@@ -128,13 +237,29 @@ class CausalPrompt:
         prompt0: (str) the opening prompt 
     """
 
-    def __init__(self, query, data, additional_info=""):
+    def __init__(self, query, data, additional_info="", tiered=False, cheap_model=CHEAP_MODEL,
+                 expensive_model=DEFAULT_MODEL, stream_edges=False, max_stream_attempts=3):
 
         instruction1 = "Respond with only the variable name. Avoid full sentences"
         instruction2 = "Respond with only the variable names, separated by commas"
 
         self.query = query
         self.other_info = additional_info
+        self.data = data
+        self.column_index = ColumnIndex(data.columns) if data is not None else None
+        self.history = []
+        self.answers = {}
+        self.use_cache = True
+        self.preset_answers = {}
+        self.stream_edges = stream_edges
+        self.max_stream_attempts = max_stream_attempts
+        self.tiered = tiered
+        self.models = {"cheap": cheap_model, "expensive": expensive_model}
+        self.usage = {tier: {"calls": 0, "latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+                      for tier in ["heuristic", "cheap", "expensive"]}
+        self.usage["escalations"] = 0
+        self.usage["stream_aborts"] = 0
+        self.usage["expensive_tokens_avoided"] = 0
 
         self.prompt0 = construct_prompt_0()
         self.prompt_query = construct_prompt_1(query, data, additional_info)
@@ -145,8 +270,32 @@ class CausalPrompt:
 
         self.all_query_prompts = {"query": self.prompt_query, "covar":self.prompt_covar, 
                                  "treat":self.prompt_treat, "edges":self.prompt_edge, "outcome":self.prompt_out}
+        self.order = ["query", "treat", "outcome", "covar", "edges"]
+
+    def seed_edges(self, directed, undirected):
+        """
+        Replaces the edge prompt with one that only orients / prunes the edges found by structure discovery
+
+        Args:
+            directed: (List[(str, str)]) edges whose direction was found from the data
+            undirected: (List[(str, str)]) edges whose direction is unknown
+        """
 
+        self.prompt_edge = ask_orient_edges(directed, undirected)
+        self.all_query_prompts["edges"] = self.prompt_edge
 
+    def skip_prompts(self, keys):
+        """
+        Removes the prompts from the sequence sent to GPT, e.g. when the answers come from the data instead
+
+        Args:
+            keys: (List[str]) keys of the prompts in all_query_prompts
+        """
+
+        self.order = [key for key in self.order if key not in keys]
+
+
+    @traced()
     def send_query_gpt(self, include_confounder=False):
         """
         Sends a sequence of queries to GPT and collects the responses
@@ -167,16 +316,212 @@ class CausalPrompt:
         answers = {}
         print("Asking GPT to help answer the query: {}".format(self.query))
         print("------------------------------------------------------")
-        all_history = [ {"role": "system", "content": "Clear memory. Start fresh."},
-                        {"role":"system", "content": self.prompt0}]
-        order = ["query", "treat", "outcome", "covar", "edges"]
-        for key in order:
+        all_history = self.build_history({})
+        for key in self.order:
             q = self.all_query_prompts[key]
-            answer = interface_gpt(all_history, q)
+            answer = self.answer_prompt(all_history, key)
             print(f"Q: {q}\nA: {answer}\n")
             all_history.append({"role": "assistant", "content": answer})
             answers[key] = answer
         print("-------------------Done----------------\n")
+        self.history = all_history
+        self.answers = answers
+        if self.tiered:
+            print(self.usage_report())
         #sys.exit()
 
-        return answers
\ No newline at end of file
+        return answers
+
+    def build_history(self, answers):
+        """
+        Builds the message history that precedes the next prompt, given the answers so far
+
+        Args:
+            answers: (dict) maps the keys of the answered prompts to their answers
+
+        Returns:
+            (List[dict])
+        """
+
+        history = [{"role": "system", "content": "Clear memory. Start fresh."},
+                   {"role": "system", "content": self.prompt0}]
+        for key in self.order:
+            if key not in answers:
+                break
+            history.append({"role": "user", "content": self.all_query_prompts[key]})
+            history.append({"role": "assistant", "content": answers[key]})
+
+        return history
+
+    def next_prompt(self, answers):
+        """
+        Args:
+            answers: (dict) maps the keys of the answered prompts to their answers
+
+        Returns:
+            (str / None) key of the next prompt in the sequence, None if all prompts are answered
+        """
+
+        for key in self.order:
+            if key not in answers:
+                return key
+
+        return None
+
+    def is_valid_column(self, answer):
+        """
+        Checks whether the answer names a column of the data
+
+        Args:
+            answer: (str / None) the answer to the prompt
+
+        Returns:
+            (bool)
+        """
+
+        return self.column_index.match(answer) is not None
+
+    def ask_model(self, history, question, tier):
+        """
+        Sends the question to the model of the given tier and records the latency and the token usage
+
+        Args:
+            history: (List[dict]) past prompts and responses. The question is appended to it
+            question: (str) the question of interest
+            tier: (str) cheap / expensive
+
+        Returns:
+            (str) response to the prompt
+        """
+
+        start = time.perf_counter()
+        answer = interface_gpt(history, question, model=self.models[tier], usage=self.usage[tier],
+                               use_cache=self.use_cache)
+        self.usage[tier]["latency"] += time.perf_counter() - start
+        self.usage[tier]["calls"] += 1
+
+        return answer
+
+    def stream_edge_answer(self, history, question):
+        """
+        Streams the edge answer from the expensive model, parsing the edges as they arrive. An answer that
+        is already invalid (a cycle or unknown variables) is aborted and asked again. If every attempt is
+        aborted, the complete answer is asked without streaming, so the validation of the query sees the whole
+        edge list instead of the prefix received before the abort.
+
+        Args:
+            history: (List[dict]) past prompts and responses. The question is appended to it
+            question: (str) the edge prompt
+
+        Returns:
+            (str) the complete response to the prompt
+        """
+
+        tier = self.usage["expensive"]
+        for attempt in range(self.max_stream_attempts):
+            if attempt != 0:
+                history.pop()
+            start = time.perf_counter()
+            answer, reason = stream_gpt(history, question, StreamingEdgeParser(self.column_index),
+                                        model=self.models["expensive"])
+            tier["latency"] += time.perf_counter() - start
+            tier["calls"] += 1
+            tier["completion_tokens"] += len(answer) // 4
+            if reason is None:
+                return answer
+            print(f"Aborted the edge answer: {reason}")
+            self.usage["stream_aborts"] += 1
+
+        print(f"Every streamed edge answer was aborted. Asking {self.models['expensive']} without streaming")
+        history.pop()
+
+        return self.ask_model(history, question, "expensive")
+
+    def answer_prompt(self, history, key):
+        """
+        Answers the prompt associated with the key. Without tiering, every prompt goes to the expensive model.
+        Answers given in preset_answers (e.g. from a batch run) are used without sending the prompt.
+        With tiering, the treatment / outcome are first looked up in the column names (only kept if the query or
+        the additional information names the column), then asked to the cheap model, and escalated to the
+        expensive model only when the cheap answer is not a column of the data.
+
+        Args:
+            history: (List[dict]) past prompts and responses. The prompt and the answer are appended to it
+            key: (str) the key of the prompt in all_query_prompts
+
+        Returns:
+            (str) response to the prompt
+        """
+
+        question = self.all_query_prompts[key]
+        if key in self.preset_answers:
+            history.append({"role": "user", "content": question})
+            return self.preset_answers[key]
+        if key == "edges" and self.stream_edges:
+            return self.stream_edge_answer(history, question)
+        if not self.tiered or key not in CHEAP_KEYS or (key != "query" and self.data is None):
+            return self.ask_model(history, question, "expensive")
+
+        start = time.perf_counter()
+        guess = guess_column(self.data, HEURISTIC_COLUMNS.get(key, []))
+        if guess is not None and not is_consistent_guess(guess, self.query, self.other_info, self.data.columns):
+            print(f"Column '{guess}' is not named in the query. Asking {self.models['cheap']}")
+            guess = None
+        if guess is not None:
+            history.append({"role": "user", "content": question})
+            self.usage["heuristic"]["latency"] += time.perf_counter() - start
+            self.usage["heuristic"]["calls"] += 1
+            self.usage["expensive_tokens_avoided"] += estimate_tokens(history)
+            return guess
+
+        answer = self.ask_model(history, question, "cheap")
+        if key == "query" or self.is_valid_column(answer):
+            self.usage["expensive_tokens_avoided"] += estimate_tokens(history)
+            return answer
+
+        print(f"Cheap answer '{answer}' is not a variable in the data. Asking {self.models['expensive']}")
+        history.pop()
+        self.usage["escalations"] += 1
+
+        return self.ask_model(history, question, "expensive")
+
+    def reprompt(self, key, feedback):
+        """
+        Asks the prompt associated with the key again after the previous answer failed validation.
+        Only this answer is replaced; the other answers are kept.
+
+        Args:
+            key: (str) the key of the prompt in all_query_prompts
+            feedback: (str) why the previous answer was rejected
+
+        Returns:
+            (dict) the updated answers
+        """
+
+        question = ("Your answer to '{}' is invalid: {} The available variables are: {}. {}"
+                    .format(self.all_query_prompts[key], feedback, ", ".join(map(str, self.data.columns)),
+                            self.all_query_prompts[key]))
+        answer = self.ask_model(self.history, question, "expensive")
+        print(f"Q: {question}\nA: {answer}\n")
+        self.history.append({"role": "assistant", "content": answer})
+        self.answers[key] = answer
+
+        return self.answers
+
+    def usage_report(self):
+        """
+        Summarizes the number of calls, latency and token usage of each tier
+
+        Returns:
+            (str)
+        """
+
+        lines = []
+        for tier in ["heuristic", "cheap", "expensive"]:
+            info = self.usage[tier]
+            lines.append(f"{tier}: calls={info['calls']}, latency={info['latency']:.2f}s, "
+                         f"prompt_tokens={info['prompt_tokens']}, completion_tokens={info['completion_tokens']}")
+        lines.append(f"escalations: {self.usage['escalations']}, stream aborts: {self.usage['stream_aborts']}, "
+                     f"expensive tokens avoided (approx.): {self.usage['expensive_tokens_avoided']}")
+
+        return "\n".join(lines)
@@ -3,6 +3,9 @@
 from gpt import restructure_gpt_response
 from graph import CausalGraph
 from prompt import CausalPrompt
+from validation import validate_formalized_query
+from discovery import discover_structure, complete_orientation
+from profiling import traced
 
 class CausalQuery:
     """
@@ -11,16 +14,43 @@ class CausalQuery:
         query: (str) the original query from the user
         data: (df) the data on which we run the inference
         hidden_vars: (bool) wehther to include hidden vars or not
+        tiered: (bool) whether to answer the cheap prompts with heuristics / a small model first
+        max_reprompts: (int) how many times an answer that fails validation against the data is asked again
+        discovery: (str / None) seed: structure learning on the data finds the candidate edges, and GPT only
+                   orients / prunes them. replace: the learned structure is used as the graph, and GPT is only
+                   asked for the treatment and outcome. None: GPT gives the edges
+        discovery_options: (dict / None) arguments passed to discovery.discover_structure
+        responses: (dict / None) answers to the prompts obtained beforehand (e.g. by batch.py). The graph is built
+                   from them without sending these prompts
+        stream_edges: (bool) whether to stream the edge answer and abort it as soon as it is invalid
     """
 
-    def __init__(self, query, data=None, hidden_vars=False, additional_info=""):
+    @traced("CausalQuery.__init__")
+    def __init__(self, query, data=None, hidden_vars=False, additional_info="", tiered=False, max_reprompts=2,
+                 discovery=None, discovery_options=None, responses=None, stream_edges=False):
 
         self.query = query
-        self.prompt = CausalPrompt(query, data=data, additional_info=additional_info)
+        self.prompt = CausalPrompt(query, data=data, additional_info=additional_info, tiered=tiered,
+                                   stream_edges=stream_edges)
         # if data is None:
         #     data = find_data(query) # retrieve the dataset that is best for the query
         self.data = data
         self.hidden_vars = hidden_vars
+        self.prompt.preset_answers = dict(responses or {})
+        self.max_reprompts = max_reprompts
+        self.discovery = discovery
+        self.structure = None
+        if discovery is not None:
+            if data is None:
+                raise ValueError("Structure discovery requires data")
+            if discovery not in ["seed", "replace"]:
+                raise ValueError(f"{discovery} is not a valid discovery mode")
+            print("Learning the structure from data")
+            self.structure = discover_structure(data, **(discovery_options or {}))
+            if discovery == "seed":
+                self.prompt.seed_edges(self.structure["directed"], self.structure["undirected"])
+            else:
+                self.prompt.skip_prompts(["covar", "edges"])
         while True:
             print("Building graph")
             self.formalized_query = self.formalize_query()
@@ -33,10 +63,15 @@ class CausalQuery:
                 print("Graph does not contain cycles")
                 break 
             else:
+                if responses is not None:
+                    raise ValueError("The graph built from the given responses contains a cycle")
                 print("Detected cycles. Re-creating the graph")
+                ## a cached response would give the same graph again
+                self.prompt.use_cache = False
 
         self.additional_info = additional_info
 
+    @traced()
     def formalize_query(self):
 
         ## these are some examples. The responses from gpt are structured in this format before using them to build the
@@ -50,8 +85,71 @@ class CausalQuery:
         raw_response = self.prompt.send_query_gpt(self.hidden_vars)
         #print(example)
         #print(raw_response1)
+        if self.discovery == "replace":
+            raw_response = self.add_discovered_edges(raw_response)
+
+        return self.validate_response(raw_response)
+
+    def add_discovered_edges(self, raw_response):
+        """
+        Fills the covariate and edge answers with the structure learned from the data
+
+        Args:
+            raw_response: (dict) the GPT responses to the treatment / outcome prompts
 
-        return restructure_gpt_response(raw_response)
+        Returns:
+            (dict) the responses in the format of CausalPrompt.send_query_gpt
+        """
+
+        index = self.prompt.column_index
+        treat_var = index.match(raw_response["treat"]) or raw_response["treat"]
+        outcome_var = index.match(raw_response["outcome"]) or raw_response["outcome"]
+        edges = complete_orientation(self.structure, treat_var, outcome_var)
+        raw_response["covar"] = ", ".join(var for var in self.structure["variables"]
+                                          if var not in [treat_var, outcome_var])
+        raw_response["edges"] = "\n".join(f"{u} -> {v}" for u, v in edges)
+
+        return raw_response
+
+    @traced()
+    def validate_response(self, raw_response):
+        """
+        Validates the GPT response against the columns of the data. Names are repaired when possible, and
+        only the answers that cannot be repaired are asked again.
+
+        Args:
+            raw_response: (dict) the GPT responses to the prompts
+
+        Returns:
+            (dict) the restructured response (see gpt.restructure_gpt_response)
+
+        Raises:
+            ValueError: if the response is still invalid after max_reprompts attempts
+        """
+
+        formalized = restructure_gpt_response(raw_response)
+        if self.data is None:
+            return formalized
+
+        for attempt in range(self.max_reprompts + 1):
+            formalized, faulty = validate_formalized_query(formalized, self.prompt.column_index)
+            if len(faulty) == 0:
+                return formalized
+            if attempt == self.max_reprompts:
+                break
+            ## with discovery=replace the edges come from the data, so only the treatment / outcome are asked again
+            retry = {key: reason for key, reason in faulty.items() if self.discovery != "replace" or key != "edges"}
+            if len(retry) == 0:
+                break
+            for key, reason in retry.items():
+                print(f"Invalid answer for {key}: {reason} Asking again")
+                raw_response = self.prompt.reprompt(key, reason)
+            if self.discovery == "replace":
+                ## the discovered edges were oriented around the rejected treatment / outcome
+                raw_response = self.add_discovered_edges(raw_response)
+            formalized = restructure_gpt_response(raw_response)
+
+        raise ValueError("The GPT response could not be matched to the data: {}".format(faulty))
 
     def plot_graph(self):
         """
@@ -67,6 +165,13 @@ class CausalQuery:
 
         return self.query
 
+    def get_usage(self):
+        """
+        returns the latency / token usage of the prompts sent so far
+        """
+
+        return self.prompt.usage
+
     def get_graph(self):
         """
         returns the causal graph
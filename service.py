@@ -0,0 +1,309 @@
+## This file defines a long-running service that answers causal queries while keeping the datasets,
+## identified models and GPT responses in memory
+
+import os
+import stat
+import json
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+
+from gpt import enable_response_cache
+from query import CausalQuery
+from inference import DowhyInference, AnankeInference
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that keeps at most max_size entries, evicting the least recently used one
+
+    Attributes:
+        max_size: (int) the largest number of entries
+        entries: (OrderedDict) the entries, from the least to the most recently used
+    """
+
+    def __init__(self, max_size):
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+
+        with self.lock:
+            return key in self.entries
+
+    def __getitem__(self, key):
+
+        with self.lock:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def __setitem__(self, key, value):
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+
+        with self.lock:
+            return len(self.entries)
+
+    def get(self, key, default=None):
+
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def setdefault(self, key, value):
+        """
+        Returns the entry of the key, storing value first if there is none
+        """
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = value
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def evict(self, predicate):
+        """
+        Removes the entries whose key satisfies the predicate
+
+        Args:
+            predicate: (callable) called with each key
+
+        Returns:
+            (int) the number of removed entries
+        """
+
+        with self.lock:
+            keys = [key for key in self.entries if predicate(key)]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def keys(self):
+
+        with self.lock:
+            return list(self.entries)
+
+
+class CausalService:
+    """
+    Answers causal queries on the datasets of a folder. Loaded datasets, identified DoWhy models and
+    GPT responses are cached across requests, each in a cache of bounded size.
+
+    Attributes:
+        data_folder: (Path) folder containing the datasets
+        datasets: (LRUCache) maps the dataset name to its modification time and DataFrame
+        identified: (LRUCache) maps (dataset, modification time, graph) to a lock and the identified
+                    DowhyInference
+        responses: (LRUCache) the GPT response cache
+    """
+
+    def __init__(self, data_folder, max_datasets=8, max_models=64, max_responses=10000):
+
+        self.data_folder = Path(data_folder).resolve()
+        self.datasets = LRUCache(max_datasets)
+        self.identified = LRUCache(max_models)
+        self.responses = enable_response_cache(LRUCache(max_responses))
+
+    def load_dataset(self, name):
+        """
+        Loads the dataset, reusing the cached copy unless the file was modified. When the file is reloaded,
+        the models identified on the previous version are evicted.
+
+        Args:
+            name: (str) path of the csv file, relative to the data folder
+
+        Returns:
+            (float) the modification time of the loaded file, which identifies its version
+            (pd.DataFrame)
+        """
+
+        path = (self.data_folder / name).resolve()
+        if self.data_folder not in path.parents:
+            raise ValueError(f"{name} is not in the data folder")
+        mtime = os.path.getmtime(path)
+        cached = self.datasets.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached
+        data = pd.read_csv(path)
+        self.datasets[name] = (mtime, data)
+        evicted = self.identified.evict(lambda key: key[0] == name and key[1] != mtime)
+        if cached is not None:
+            print(f"{name} was modified. Reloaded it and evicted {evicted} identified models")
+
+        return mtime, data
+
+    def identify(self, name, version, graph, data):
+        """
+        Returns the identified DoWhy model of the graph, reusing the cached one if the same graph was
+        identified on the same version of the dataset before
+
+        Args:
+            name: (str) the dataset name
+            version: (float) the modification time of the dataset (see load_dataset)
+            graph: (CausalGraph)
+            data: (pd.DataFrame)
+
+        Returns:
+            (threading.Lock) lock that must be held while estimating with the model
+            (DowhyInference)
+        """
+
+        key = (name, version, graph.get_treatment_var(), graph.get_outcome_var(), graph.to_dot())
+        cached = self.identified.get(key)
+        if cached is not None:
+            return cached
+        infer = DowhyInference(graph, data)
+        infer.identification(False)
+
+        return self.identified.setdefault(key, (threading.Lock(), infer))
+
+    def run(self, request):
+        """
+        Answers the query, yielding the graph, the estimand and the estimates as soon as each is ready
+
+        Args:
+            request: (dict) with keys query, dataset and optionally additional_info, method, tiered
+
+        Returns:
+            (generator[dict])
+        """
+
+        name = request["dataset"]
+        version, data = self.load_dataset(name)
+        cq = CausalQuery(request["query"], data=data, additional_info=request.get("additional_info", ""),
+                         tiered=request.get("tiered", False))
+        graph = cq.get_graph()
+        yield {"stage": "graph", "treatment": graph.get_treatment_var(), "outcome": graph.get_outcome_var(),
+               "edges": [list(edge) for edge in graph.edges()]}
+
+        lock, infer = self.identify(name, version, graph, data)
+        yield {"stage": "estimand", "identified": infer.is_identified(), "estimand": str(infer.estimand)}
+
+        if infer.is_identified():
+            with lock:
+                estimates = infer.estimation(method_back=request.get("method", "linear_regression"))
+        else:
+            tool = AnankeInference(graph, data)
+            tool.identification()
+            estimates = tool.estimation()
+        yield {"stage": "estimate", "estimates": estimates}
+
+    def status(self):
+        """
+        Returns:
+            (dict) the content of the caches
+        """
+
+        return {"datasets": sorted(self.datasets.keys()), "identified": len(self.identified),
+                "responses": len(self.responses)}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    POST /query streams the stages of CausalService.run as JSON lines. GET /status returns the cache content.
+    """
+
+    service = None
+
+    def address_string(self):
+
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix-socket"
+
+    def send_json(self, code, content):
+
+        body = (json.dumps(content) + "\n").encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        if self.path != "/status":
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+        else:
+            self.send_json(200, self.service.status())
+
+    def do_POST(self):
+
+        if self.path != "/query":
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if "query" not in request or "dataset" not in request:
+                raise ValueError("the request needs a query and a dataset")
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        ## no content length: the stream ends when the connection is closed
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for event in self.service.run(request):
+                self.wfile.write((json.dumps(event, default=str) + "\n").encode())
+                self.wfile.flush()
+        except Exception as e:
+            print("Got the following error: {}".format(e))
+            self.wfile.write((json.dumps({"stage": "error", "error": str(e)}) + "\n").encode())
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server listening on a Unix socket
+    """
+
+    daemon_threads = True
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_folder", help="folder containing the datasets")
+    parser.add_argument("--host", help="host of the HTTP server", default="127.0.0.1")
+    parser.add_argument("--port", help="port of the HTTP server", type=int, default=8000)
+    parser.add_argument("--socket", help="path of a Unix socket to listen on instead of host/port")
+    parser.add_argument("--max_datasets", help="number of datasets kept in memory", type=int, default=8)
+    parser.add_argument("--max_models", help="number of identified models kept in memory", type=int, default=64)
+    parser.add_argument("--max_responses", help="number of GPT responses kept in memory", type=int,
+                        default=10000)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    ServiceHandler.service = CausalService(args.data_folder, args.max_datasets, args.max_models,
+                                           args.max_responses)
+    if args.socket is not None:
+        if os.path.exists(args.socket) and stat.S_ISSOCK(os.stat(args.socket).st_mode):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, ServiceHandler)
+        print(f"Serving on {args.socket}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+        print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,5 @@
+## The modules of the repository are imported from its root, as in the scripts of main/
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("scipy")
+pytest.importorskip("sklearn")
+
+from approximate import stratified_order, approximate_effect
+
+
+def linear_data(size=5000, seed=0):
+
+    rng = np.random.default_rng(seed)
+    w = rng.normal(size=size)
+    t = (rng.random(size) < 0.2 + 0.5 * (w > 0)).astype(int)
+    y = 2 * t + w + rng.normal(size=size)
+    ## a non-default index, since the subsamples are read by position
+    return pd.DataFrame({"t": t, "y": y, "w": w, "s": rng.integers(0, 3, size)}, index=rng.permutation(size) * 7)
+
+
+def test_prefixes_are_stratified():
+
+    codes = np.repeat([0, 1, 2], [600, 300, 100])
+    order = stratified_order(codes, np.random.default_rng(0))
+
+    assert sorted(order.tolist()) == list(range(1000))
+    for size in [10, 100, 500]:
+        counts = np.bincount(codes[order[:size]], minlength=3)
+        assert np.all(np.abs(counts - size * np.array([0.6, 0.3, 0.1])) <= 1)
+
+
+def test_full_sample_matches_least_squares():
+
+    data = linear_data()
+    result = approximate_effect(data, "t", "y", ["w"], width=0.0, initial_size=500, stratify_on=["t", "s"])
+    Z = np.column_stack([np.ones(len(data)), data["t"], data["w"]])
+    beta = np.linalg.lstsq(Z, data["y"].to_numpy(), rcond=None)[0]
+
+    assert result["rows"] == len(data) and result["error_bound"] == 0.0
+    assert result["estimate"] == pytest.approx(beta[1], rel=1e-9)
+
+
+def test_stops_once_the_interval_is_narrow():
+
+    data = linear_data(size=20000)
+    result = approximate_effect(data, "t", "y", ["w"], width=0.2, initial_size=1000)
+
+    assert result["rows"] < len(data)
+    assert 2 * result["error_bound"] <= 0.2
+    assert abs(result["estimate"] - 2) < 0.2
+
+
+def test_effect_modifiers_are_interacted_with_the_treatment():
+
+    data = linear_data()
+    data["y"] += data["t"] * data["s"]
+    result = approximate_effect(data, "t", "y", ["w"], width=0.0, initial_size=500, effect_modifiers=["s"])
+    Z = np.column_stack([np.ones(len(data)), data["t"], data["w"], data["t"] * data["s"]])
+    beta = np.linalg.lstsq(Z, data["y"].to_numpy(), rcond=None)[0]
+
+    assert result["estimate"] == pytest.approx(beta[1] + beta[3] * data["s"].mean(), rel=1e-9)
+
+
+def test_full_sample_matches_dowhy_linear_regression():
+
+    pytest.importorskip("dowhy")
+    from graph import CausalGraph
+    from inference import DowhyInference
+
+    data = linear_data()
+    data["y"] += data["t"] * data["s"]
+    graph = CausalGraph("t", "y", ["w", "s"], [("w", "t"), ("w", "y"), ("t", "y"), ("s", "y")])
+    infer = DowhyInference(graph, data)
+    infer.identification(False)
+    assert "s" in infer.model.get_effect_modifiers()
+    result = infer.approximate_backdoor_estimation(0.0, initial_size=500)
+
+    assert result["rows"] == len(data)
+    assert result["estimate"] == pytest.approx(infer.backdoor_estimation("linear_regression"), rel=1e-9)
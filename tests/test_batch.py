@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("dowhy")
+pytest.importorskip("openai")
+
+ROOT = Path(__file__).resolve().parents[1]
+ORDER = ["query", "treat", "outcome", "covar", "edges"]
+
+
+def run_batch(*args):
+
+    result = subprocess.run([sys.executable, str(ROOT / "batch.py"), *args], cwd=ROOT, capture_output=True,
+                            text=True, env=dict(os.environ, OPENAI_API_KEY="unused"))
+    assert result.returncode == 0, result.stderr
+
+    return result.stdout
+
+
+@pytest.fixture
+def benchmark(tmp_path):
+    """
+    two datasets; the answers of the second one name a treatment that is not in its data
+    """
+
+    rng = np.random.default_rng(0)
+    data_folder = tmp_path / "data"
+    data_folder.mkdir()
+    for name in ["first.csv", "second.csv"]:
+        w = rng.normal(size=2000)
+        t = (w + rng.normal(size=2000) > 0).astype(int)
+        pd.DataFrame({"reminder": t, "payments": 2 * t + w + rng.normal(size=2000), "credit": w}) \
+            .to_csv(data_folder / name, index=False)
+    info = [{"question": "What is the effect of the reminder on payments?", "data_description": "A study.",
+             "answer": "2.0", "data_files": [name]} for name in ["first.csv", "second.csv"]]
+    with open(tmp_path / "info.json", "w") as f:
+        json.dump(info, f)
+    answers = {name: {"query": "yes", "treat": treat, "outcome": "payments", "covar": "credit",
+                      "edges": "credit -> reminder\ncredit -> payments\nreminder -> payments"}
+               for name, treat in [("first.csv", "reminder"), ("second.csv", "discount")]}
+    with open(tmp_path / "answers.json", "w") as f:
+        json.dump(answers, f)
+
+    return tmp_path, answers
+
+
+def test_rounds_until_inference(benchmark):
+
+    tmp_path, answers = benchmark
+    work_dir = tmp_path / "work"
+    local = ["--work_dir", str(work_dir), "--backend", "local", "--answers", str(tmp_path / "answers.json")]
+    run_batch("prepare", "--json_filepath", str(tmp_path / "info.json"), "--data_folder", str(tmp_path / "data"),
+              *local)
+
+    ## each round answers the next prompt of both datasets
+    for answered in range(1, len(ORDER) + 1):
+        run_batch("ingest", "--output_folder", str(tmp_path / "output"), "--data_name", "batch", *local)
+        with open(work_dir / "state.json") as f:
+            state = json.load(f)
+        assert state["round"] == answered
+        for item in state["items"]:
+            assert list(item["answers"]) == ORDER[:answered]
+            assert item["answers"] == {key: answers[item["data_file"]][key] for key in ORDER[:answered]}
+    assert sorted(path.name for path in work_dir.glob("round_*.jsonl")) == [f"round_{i}.jsonl"
+                                                                            for i in range(len(ORDER))]
+
+    ## the second dataset is skipped since its treatment is not in the data
+    results = pd.read_csv(tmp_path / "output" / "batch.csv")
+    assert results["data_name"].tolist() == ["first.csv"]
+    assert results["true"].tolist() == [2.0]
+    assert results["predicted_backdoor"][0] == pytest.approx(2.0, abs=0.2)
@@ -0,0 +1,48 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+pytest.importorskip("dowhy")
+pytest.importorskip("ananke")
+
+from pathlib import Path
+from main.ihdp_cate import IHDP_ATT, ihdp_graph
+from inference import DowhyInference
+
+IHDP_0 = Path(__file__).resolve().parents[1] / "benchmark" / "qrdata" / "data" / "ihdp_0.csv"
+## the forest learners are not seeded; their effect on the treated varies by less than 0.1 between runs
+TOLERANCE = 0.3
+
+
+@pytest.fixture(scope="module")
+def ihdp():
+
+    data = pd.read_csv(IHDP_0)
+    infer = DowhyInference(ihdp_graph(data), data)
+    infer.identification(False)
+
+    return data, infer
+
+
+@pytest.mark.parametrize("learner", ["s", "t", "x"])
+def test_effect_on_the_treated_matches_ihdp(ihdp, learner):
+
+    data, infer = ihdp
+    cate = infer.cate_estimation(learner, "forest")
+    att = cate.average_effect(data[data["treatment"] == 1])
+
+    assert abs(att - IHDP_ATT) < TOLERANCE
+
+
+def test_segment_effects_do_not_depend_on_the_chunks(ihdp):
+
+    data, infer = ihdp
+    cate = infer.cate_estimation("t", "linear")
+    single = cate.segment_effects(data, "x7", chunk_size=len(data))
+    chunked = cate.segment_effects(data, "x7", chunk_size=50)
+    iterated = cate.segment_effects((data.iloc[i:i + 100] for i in range(0, len(data), 100)), "x7")
+
+    pd.testing.assert_frame_equal(single, chunked, rtol=1e-9)
+    pd.testing.assert_frame_equal(single, iterated, rtol=1e-9)
+    assert single["count"].sum() == len(data)
+    assert cate.average_effect(data, chunk_size=len(data)) == pytest.approx(cate.average_effect(data, chunk_size=50))
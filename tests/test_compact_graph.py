@@ -0,0 +1,85 @@
+import pytest
+
+nx = pytest.importorskip("networkx")
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("matplotlib")
+
+from graph import CausalGraph
+from util import format_graph_DOT
+
+
+def reference_graph(treat_var, outcome_var, other_vars, edge_list, unobserved_vars=None, unobserved_edges=None):
+    """
+    the networkx graph that CausalGraph built eagerly before the compact representation
+    """
+
+    graph = nx.DiGraph()
+    graph.add_node(treat_var, observed=True, treatment=True, outcome=False)
+    graph.add_node(outcome_var, observed=True, treatment=False, outcome=True)
+    for node in other_vars:
+        graph.add_node(node, observed=True, treatment=False, outcome=False)
+    graph.add_edges_from([(u, v, {'observed': True}) for u, v in edge_list])
+    for node in unobserved_vars or []:
+        graph.add_node(node, observed=False, treatment=False, outcome=False)
+    graph.add_edges_from([(u, v, {'observed': False}) for u, v in unobserved_edges or []])
+
+    return graph
+
+
+def networkx_ananke(graph):
+
+    nodes = [node for node, observed in graph.nodes(data="observed") if observed is not False]
+    di_edges = [(u, v) for u, v, observed in graph.edges(data="observed") if observed]
+    bi_edges = [(u, v) for u, v, observed in graph.edges(data="observed") if not observed]
+
+    return nodes, di_edges, bi_edges
+
+
+def random_graph(rng, n_nodes=15, n_edges=30):
+
+    names = [f"v{i}" for i in range(n_nodes)]
+    pairs = {(names[u], names[v]) for u, v in rng.integers(0, n_nodes, size=(n_edges, 2)).tolist() if u != v}
+    pairs = sorted(pairs)
+    hidden = names[1:3]
+    observed = [e for e in pairs if e[0] not in hidden and e[1] not in hidden]
+    unobserved = [e for e in pairs if e[0] in hidden or e[1] in hidden]
+    ## extra only appears in the edges
+    return (names[0], names[-1], names[3:-2], observed + [("extra", names[0])], hidden, unobserved)
+
+
+def test_serialization_matches_networkx():
+
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        spec = random_graph(rng)
+        graph = CausalGraph(*spec[:4], unobserved_vars=spec[4], unobserved_edges=spec[5])
+        reference = reference_graph(*spec)
+        assert graph.to_dot() == format_graph_DOT(reference)
+        assert graph.create_ananke_inputs() == networkx_ananke(reference)
+        assert graph.detect_cycles() == (not nx.is_directed_acyclic_graph(reference))
+        assert graph.edges() == list(reference.edges())
+
+
+def test_networkx_graph_is_built_on_demand():
+
+    spec = random_graph(np.random.default_rng(1))
+    graph = CausalGraph(*spec[:4], unobserved_vars=spec[4], unobserved_edges=spec[5])
+    assert graph._graph is None
+
+    reference = reference_graph(*spec)
+    assert list(graph.graph.nodes) == list(reference.nodes)
+    assert list(graph.graph.edges(data="observed")) == list(reference.edges(data="observed"))
+    for node, attr in reference.nodes(data=True):
+        ## nodes that only appear in the edges had no attributes; they are observed
+        assert graph.graph.nodes[node] == (attr or {"observed": True, "treatment": False, "outcome": False})
+
+
+def test_duplicate_edges_keep_the_last_observed_attribute():
+
+    graph = CausalGraph("t", "y", ["w", "u"], [("w", "t"), ("t", "y"), ("w", "y")], unobserved_vars=["u"],
+                        unobserved_edges=[("w", "y"), ("u", "t")])
+
+    assert graph.to_dot() == format_graph_DOT(reference_graph("t", "y", ["w", "u"], graph.edge_list, ["u"],
+                                                              graph.unobserved_edges))
+    assert graph.create_ananke_inputs() == (["t", "y", "w"], [("t", "y"), ("w", "t")], [("w", "y"), ("u", "t")])
@@ -0,0 +1,54 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("dowhy")
+pytest.importorskip("ananke")
+
+from graph import CausalGraph
+from inference import DowhyInference
+
+
+def mediator_data(size=2000, seed=0):
+    """
+    w confounds t and y, t affects y through the mediator m, z modifies the effect on y and u is unused
+    """
+
+    rng = np.random.default_rng(seed)
+    w = rng.integers(0, 3, size)
+    z = rng.normal(size=size)
+    t = (rng.normal(size=size) + w > 1).astype(int)
+    m = 2 * t + rng.normal(size=size)
+    y = m + 0.5 * w + t * z + rng.normal(size=size)
+
+    return pd.DataFrame({"t": t, "y": y, "w": w, "z": z, "m": m, "u": rng.integers(0, 100, size)})
+
+
+def mediator_graph():
+
+    return CausalGraph("t", "y", ["w", "z", "m", "u"], [("w", "t"), ("w", "y"), ("t", "m"), ("m", "y"),
+                                                        ("z", "y")])
+
+
+def test_compact_data_keeps_dowhy_effect_modifiers():
+
+    infer = DowhyInference(mediator_graph(), mediator_data())
+    infer.identification(False)
+
+    ## whether DoWhy counts the mediator m as an effect modifier depends on its version
+    assert set(infer.model.get_effect_modifiers()) <= set(infer.data.columns)
+    assert set(infer.data.columns) == {"t", "y", "w", "z", "m"}
+
+
+@pytest.mark.parametrize("method", ["linear_regression", "propensity_score_weighting"])
+def test_compact_data_gives_the_same_estimate(method):
+
+    data = mediator_data()
+    estimates = []
+    for compact_data in [True, False]:
+        infer = DowhyInference(mediator_graph(), data, compact_data=compact_data)
+        infer.identification(False)
+        estimates.append(infer.backdoor_estimation(method))
+
+    assert estimates[0] is not None
+    assert estimates[0] == pytest.approx(estimates[1], rel=1e-9, abs=1e-12)
@@ -0,0 +1,99 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+nx = pytest.importorskip("networkx")
+pytest.importorskip("scipy")
+
+from discovery import discover_structure, complete_orientation
+
+
+def collider_data(size=5000, seed=0):
+    """
+    a -> c <- b and c -> d
+    """
+
+    rng = np.random.default_rng(seed)
+    a, b = rng.normal(size=size), rng.normal(size=size)
+    c = a + b + rng.normal(size=size)
+    d = c + rng.normal(size=size)
+
+    return pd.DataFrame({"a": a, "b": b, "c": c, "d": d})
+
+
+def chain_data(size=5000, seed=0):
+    """
+    a -> b -> c, which has no v-structure, so none of its edges can be oriented from the data
+    """
+
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=size)
+    b = a + rng.normal(size=size)
+    c = b + rng.normal(size=size)
+
+    return pd.DataFrame({"a": a, "b": b, "c": c})
+
+
+def linear_sem(n_vars=12, size=3000, seed=0):
+
+    rng = np.random.default_rng(seed)
+    weights = np.triu(rng.normal(size=(n_vars, n_vars)) * (rng.random((n_vars, n_vars)) < 0.3), 1)
+    values = rng.normal(size=(size, n_vars))
+    for j in range(n_vars):
+        values[:, j] += values @ weights[:, j]
+
+    return pd.DataFrame(values, columns=[f"x{j}" for j in range(n_vars)])
+
+
+def test_collider_is_recovered():
+
+    structure = discover_structure(collider_data())
+
+    assert structure["variables"] == ["a", "b", "c", "d"]
+    assert structure["directed"] == [("a", "c"), ("b", "c"), ("c", "d")]
+    assert structure["undirected"] == []
+
+
+@pytest.mark.parametrize("data", [collider_data(), linear_sem()])
+def test_parallel_tests_give_the_same_structure(data):
+
+    assert discover_structure(data, n_jobs=1) == discover_structure(data, n_jobs=4)
+
+
+def test_complete_orientation_follows_the_treatment():
+
+    structure = discover_structure(chain_data())
+    assert structure["directed"] == []
+    for treat_var, outcome_var in [("a", "c"), ("c", "a"), ("b", "a")]:
+        edges = complete_orientation(structure, treat_var, outcome_var)
+        graph = nx.DiGraph(edges)
+        assert nx.is_directed_acyclic_graph(graph)
+        assert len(edges) == 2
+        assert graph.in_degree(treat_var) == 0
+        assert graph.out_degree(outcome_var) == 0
+
+
+def test_complete_orientation_breaks_discovered_cycles():
+
+    structure = {"variables": ["t", "x", "z", "y"], "directed": [("x", "z"), ("z", "t"), ("t", "x")],
+                 "undirected": [("y", "x"), ("t", "y")]}
+    edges = complete_orientation(structure, "t", "y")
+
+    assert nx.is_directed_acyclic_graph(nx.DiGraph(edges))
+    assert sorted(edges) == [("t", "x"), ("t", "y"), ("t", "z"), ("x", "y"), ("x", "z")]
+
+
+def test_replace_mode_reorients_the_edges_after_a_reprompt(monkeypatch):
+
+    pytest.importorskip("openai")
+    from prompt import CausalPrompt
+    from query import CausalQuery
+
+    ## the first treatment is not a column, and GPT answers c when it is asked again
+    monkeypatch.setattr(CausalPrompt, "ask_model", lambda self, history, question, tier: "c")
+    query = CausalQuery("Does c affect a?", data=chain_data(), discovery="replace",
+                        responses={"query": "yes", "treat": "the treatment", "outcome": "a"})
+    graph = query.get_graph()
+
+    assert graph.get_treatment_var() == "c"
+    assert sorted(graph.edge_list) == [("b", "a"), ("c", "b")]
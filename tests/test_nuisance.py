@@ -0,0 +1,75 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+import nuisance
+from nuisance import NUISANCE_METHODS, NuisanceCache, estimate_with_nuisance
+
+ATE = 2.0
+
+
+def confounded_data(n=4000, seed=0):
+    """
+    binary treatment confounded by x1, the true ATE is 2
+    """
+
+    rng = np.random.default_rng(seed)
+    x1, x2 = rng.normal(size=n), rng.normal(size=n)
+    t = rng.binomial(1, 1 / (1 + np.exp(-0.8 * x1)))
+    y = ATE * t + 1.5 * x1 + 0.5 * x2 + rng.normal(size=n)
+
+    return pd.DataFrame({"x1": x1, "x2": x2, "t": t, "y": y})
+
+
+@pytest.mark.parametrize("method", NUISANCE_METHODS)
+def test_known_ate(method):
+
+    data = confounded_data()
+    naive = data.y[data.t == 1].mean() - data.y[data.t == 0].mean()
+    assert abs(naive - ATE) > 0.5
+    estimate = estimate_with_nuisance(method, data, "t", "y", ["x1", "x2"], n_jobs=1, cache=NuisanceCache())
+    assert estimate == pytest.approx(ATE, abs=0.25)
+
+
+def test_methods_reuse_the_cached_fit(monkeypatch):
+
+    calls = []
+
+    def counting_fit_fold(*args):
+        calls.append(1)
+        return nuisance_fit_fold(*args)
+
+    nuisance_fit_fold = nuisance.fit_fold
+    monkeypatch.setattr(nuisance, "fit_fold", counting_fit_fold)
+    data = confounded_data(n=500)
+    cache = NuisanceCache()
+    for method in NUISANCE_METHODS:
+        estimate_with_nuisance(method, data, "t", "y", ["x1", "x2"], n_folds=3, n_jobs=1, cache=cache)
+    assert len(calls) == 3
+    assert len(cache.cache) == 1
+
+
+def test_cache_evicts_the_least_recently_used_fit():
+
+    cache = NuisanceCache(max_size=2)
+    arrays = [confounded_data(n=100, seed=seed) for seed in range(3)]
+    arrays = [(d[["x1"]].to_numpy(), d.t.to_numpy(dtype=float), d.y.to_numpy()) for d in arrays]
+    first = cache.get(*arrays[0], n_folds=2, n_jobs=1)
+    second = cache.get(*arrays[1], n_folds=2, n_jobs=1)
+    assert cache.get(*arrays[0], n_folds=2, n_jobs=1) is first
+    cache.get(*arrays[2], n_folds=2, n_jobs=1)
+    assert len(cache.cache) == 2
+    ## the second fit was the least recently used one
+    assert cache.get(*arrays[0], n_folds=2, n_jobs=1) is first
+    assert cache.get(*arrays[1], n_folds=2, n_jobs=1) is not second
+    assert len(cache.cache) == 2
+
+
+def test_seeded_learners_are_reproducible():
+
+    data = confounded_data(n=300)
+    estimates = [estimate_with_nuisance("aipw", data, "t", "y", ["x1", "x2"], learner="forest", n_folds=2,
+                                        n_jobs=1, cache=NuisanceCache()) for _ in range(2)]
+    assert estimates[0] == estimates[1]
@@ -0,0 +1,108 @@
+import json
+import threading
+import tracemalloc
+
+import pytest
+
+import profiling
+from profiling import span, traced
+
+
+@pytest.fixture
+def profile(tmp_path):
+
+    profiling.enable_profiling(tmp_path / "trace.json")
+    yield tmp_path / "trace.json"
+    profiling.disable_profiling()
+    profiling._EVENTS.clear()
+
+
+def events():
+
+    return {event["name"]: event for event in profiling._EVENTS}
+
+
+def test_disabled_spans_do_nothing(tmp_path):
+
+    profiling.disable_profiling()
+    profiling._EVENTS.clear()
+
+    @traced()
+    def double(x):
+        return 2 * x
+
+    with span("outer") as outer:
+        assert double(2) == 4
+    assert not outer.active
+    assert profiling._EVENTS == []
+    assert profiling.export_trace(tmp_path / "trace.json") is None
+    assert not (tmp_path / "trace.json").exists()
+
+
+def test_nested_peaks(profile):
+
+    with span("outer"):
+        with span("inner"):
+            block = bytearray(4 * 1024 * 1024)
+            del block
+        with span("after"):
+            pass
+
+    spans = events()
+    ## the 4MB allocated in the inner span are freed before the outer span ends
+    assert spans["inner"]["args"]["peak_kb"] >= 4096
+    assert spans["outer"]["args"]["peak_kb"] >= spans["inner"]["args"]["peak_kb"]
+    assert spans["after"]["args"]["peak_kb"] < 1024
+
+
+def test_no_peak_for_spans_overlapping_other_threads(profile):
+
+    inside = threading.Event()
+    release = threading.Event()
+
+    def worker():
+        with span("worker"):
+            inside.set()
+            release.wait()
+
+    with span("main"):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        inside.wait()
+        with span("overlapping"):
+            pass
+        release.set()
+        thread.join()
+    with span("alone"):
+        pass
+
+    spans = events()
+    assert "peak_kb" not in spans["main"]["args"]
+    assert "peak_kb" not in spans["worker"]["args"]
+    assert "peak_kb" not in spans["overlapping"]["args"]
+    assert "peak_kb" in spans["alone"]["args"]
+
+
+def test_export_trace(profile):
+
+    @traced("work")
+    def work():
+        return 1
+
+    work()
+    with pytest.raises(ValueError):
+        with span("failing", step=3):
+            raise ValueError()
+
+    assert profiling.export_trace() == profile
+    with open(profile) as f:
+        trace = json.load(f)
+    assert trace["displayTimeUnit"] == "ms"
+    spans = {event["name"]: event for event in trace["traceEvents"]}
+    assert set(spans) == {"work", "failing"}
+    for event in spans.values():
+        assert event["ph"] == "X" and event["dur"] >= 0 and event["ts"] >= 0
+        assert "cpu_ms" in event["args"]
+    assert spans["failing"]["args"]["error"] == "ValueError"
+    assert spans["failing"]["args"]["step"] == 3
+    assert tracemalloc.is_tracing()
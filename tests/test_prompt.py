@@ -0,0 +1,54 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("networkx")
+pytest.importorskip("openai")
+
+import prompt
+from prompt import CausalPrompt, is_consistent_guess
+
+COLUMNS = ["treatment", "y", "x1", "x2", "x3"]
+
+
+@pytest.fixture
+def cheap_answers(monkeypatch):
+    """
+    answers the treatment / outcome prompts and records the models that were asked
+    """
+
+    models = []
+
+    def fake_gpt(messages, question, model=None, **kwargs):
+        messages.append({"role": "user", "content": question})
+        models.append(model)
+        return {"treat": "x3", "outcome": "y"}.get(fake_gpt.key, "")
+
+    monkeypatch.setattr(prompt, "interface_gpt", fake_gpt)
+    fake_gpt.key = None
+
+    return fake_gpt, models
+
+
+def test_consistent_guess():
+
+    assert is_consistent_guess("y", "What is the effect of x3 on y?", "", COLUMNS)
+    assert not is_consistent_guess("treatment", "What is the effect of x3 on y?", "", COLUMNS)
+    assert is_consistent_guess("treatment", "What is the effect of home visits?",
+                               "The `treatment` column is the home visit", COLUMNS)
+    assert not is_consistent_guess("treatment", "What is the effect of home visits?", "", COLUMNS)
+    ## single-letter names only match whole words
+    assert not is_consistent_guess("y", "Why does it happen?", "they say", COLUMNS)
+
+
+def test_heuristic_is_not_used_against_the_query(cheap_answers):
+
+    fake_gpt, models = cheap_answers
+    cp = CausalPrompt("What is the effect of x3 on y?", pd.DataFrame(columns=COLUMNS), tiered=True)
+    history = []
+
+    fake_gpt.key = "treat"
+    assert cp.answer_prompt(history, "treat") == "x3"
+    fake_gpt.key = "outcome"
+    assert cp.answer_prompt(history, "outcome") == "y"
+    assert models == [prompt.CHEAP_MODEL]
+    assert cp.usage["heuristic"]["calls"] == 1
@@ -0,0 +1,53 @@
+import os
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("dowhy")
+pytest.importorskip("ananke")
+pytest.importorskip("openai")
+
+import gpt
+from service import LRUCache, CausalService
+from graph import CausalGraph
+
+
+@pytest.fixture
+def service(tmp_path):
+
+    previous = gpt.RESPONSE_CACHE
+    yield CausalService(tmp_path, max_datasets=2, max_models=2, max_responses=2)
+    gpt.RESPONSE_CACHE = previous
+
+
+def test_lru_cache_evicts_least_recently_used():
+
+    cache = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert cache.keys() == ["a", "c"]
+    assert cache.setdefault("a", 10) == 1
+    assert cache.evict(lambda key: key == "a") == 1
+    assert len(cache) == 1
+
+
+def test_modified_dataset_is_reloaded_and_models_evicted(service, tmp_path):
+
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"t": [0, 1, 0, 1, 1, 0], "y": [1.0, 2.0, 1.5, 2.5, 3.0, 0.5],
+                  "w": [0, 1, 1, 0, 1, 0]}).to_csv(path, index=False)
+    graph = CausalGraph("t", "y", ["w"], [("w", "t"), ("w", "y"), ("t", "y")])
+
+    version, data = service.load_dataset("data.csv")
+    _, infer = service.identify("data.csv", version, graph, data)
+    assert service.load_dataset("data.csv")[1] is data
+    assert service.identify("data.csv", version, graph, data)[1] is infer
+
+    pd.DataFrame({"t": [1, 0, 1, 0], "y": [0.0, 1.0, 2.0, 3.0], "w": [1, 1, 0, 0]}).to_csv(path, index=False)
+    os.utime(path, (version + 10, version + 10))
+    new_version, new_data = service.load_dataset("data.csv")
+    assert new_version != version and len(new_data) == 4
+    assert len(service.identified) == 0
+    assert service.identify("data.csv", new_version, graph, new_data)[1].data is not infer.data
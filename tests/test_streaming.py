@@ -0,0 +1,115 @@
+import itertools
+import random
+import pytest
+
+nx = pytest.importorskip("networkx")
+pytest.importorskip("pandas")
+pytest.importorskip("matplotlib")
+pytest.importorskip("openai")
+
+from graph import IncrementalDAG
+from gpt import StreamingEdgeParser
+from validation import ColumnIndex
+
+
+def is_topological(dag):
+    return all(dag.order[u] < dag.order[v] for u, children in dag.children.items() for v in children)
+
+
+def test_add_edge_reorders_the_nodes():
+
+    dag = IncrementalDAG()
+    for node in ["a", "b", "c", "d"]:
+        dag.add_node(node)
+    ## each edge goes against the current order, so the affected region is moved
+    assert dag.add_edge("d", "c")
+    assert dag.add_edge("c", "b")
+    assert dag.add_edge("b", "a")
+    assert is_topological(dag)
+    assert sorted(dag.order, key=dag.order.get) == ["d", "c", "b", "a"]
+
+
+def test_add_edge_rejects_cycles():
+
+    dag = IncrementalDAG()
+    assert dag.add_edge("a", "b")
+    assert dag.add_edge("b", "c")
+    assert not dag.add_edge("c", "a")
+    assert not dag.add_edge("a", "a")
+    assert "a" not in dag.children["c"]
+    assert is_topological(dag)
+
+
+def test_add_edge_matches_networkx():
+
+    rng = random.Random(0)
+    nodes = list(range(12))
+    for _ in range(50):
+        dag = IncrementalDAG()
+        reference = nx.DiGraph()
+        pairs = list(itertools.permutations(nodes, 2))
+        rng.shuffle(pairs)
+        for u, v in pairs[:40]:
+            reference.add_edge(u, v)
+            acyclic = nx.is_directed_acyclic_graph(reference)
+            if not acyclic:
+                reference.remove_edge(u, v)
+            assert dag.add_edge(u, v) == acyclic
+            assert is_topological(dag)
+
+
+def test_parser_finds_a_cycle_out_of_order():
+
+    parser = StreamingEdgeParser(ColumnIndex(["age", "income", "health", "smoking"]))
+    ## the closing edge of the cycle arrives before the edges that complete it
+    assert parser("health -> age") is None
+    assert parser("smoking -> health") is None
+    assert parser("Age -> Income") is None
+    reason = parser("income -> smoking")
+    assert reason is not None and "cycle" in reason
+
+
+def test_parser_unknown_threshold():
+
+    parser = StreamingEdgeParser(ColumnIndex(["age", "income"]), max_unknown=2)
+    assert parser("age -> income") is None
+    assert parser("weather -> income") is None
+    ## the same unknown name is only counted once
+    assert parser("weather -> age") is None
+    assert parser("mood -> age") is None
+    reason = parser("luck -> income")
+    assert reason is not None and "unknown variables" in reason
+    assert "luck" in reason and "mood" in reason and "weather" in reason
+
+
+def test_parser_ignores_lines_without_edges():
+
+    parser = StreamingEdgeParser(ColumnIndex(["age", "income"]))
+    assert parser("Here are the edges:") is None
+    assert parser("") is None
+    assert parser("age -> income -> age") is not None
+
+
+def test_aborted_stream_falls_back_to_complete_answer(monkeypatch):
+
+    import prompt
+    pd = pytest.importorskip("pandas")
+
+    def aborted_stream(messages, question, on_line, **kwargs):
+        messages.append({"role": "user", "content": question})
+        return "a -> b", "unknown variables: x, y, z"
+
+    def complete_answer(messages, question, **kwargs):
+        messages.append({"role": "user", "content": question})
+        return "a -> b\nb -> c"
+
+    monkeypatch.setattr(prompt, "stream_gpt", aborted_stream)
+    monkeypatch.setattr(prompt, "interface_gpt", complete_answer)
+    cp = prompt.CausalPrompt("effect of a on c", pd.DataFrame(columns=["a", "b", "c"]), stream_edges=True,
+                             max_stream_attempts=2)
+    history = []
+    answer = cp.stream_edge_answer(history, cp.prompt_edge)
+
+    assert answer == "a -> b\nb -> c"
+    assert cp.usage["stream_aborts"] == 2
+    assert [m["role"] for m in history] == ["user"]
@@ -0,0 +1,59 @@
+from validation import ColumnIndex, edit_distance, validate_formalized_query
+
+IHDP_COLUMNS = ["treatment", "y"] + [f"x{i}" for i in range(1, 26)]
+
+
+def test_exact_and_normalized_names():
+
+    index = ColumnIndex(["birth_weight", "Mother Age", "treatment"])
+    assert index.match("treatment") == "treatment"
+    assert index.match("`treatment`.") == "treatment"
+    assert index.match("Birth Weight") == "birth_weight"
+    assert index.match("mother_age") == "Mother Age"
+    assert index.match(None) is None
+
+
+def test_misspelled_names_are_repaired():
+
+    index = ColumnIndex(["birth_weight", "mother_age", "treatment"])
+    assert index.match("birth_wieght") == "birth_weight"
+    assert index.match("treatmnt") == "treatment"
+    assert index.match("weather") is None
+
+
+def test_ambiguous_names_are_not_matched():
+
+    index = ColumnIndex(["income_a", "income_b"])
+    assert index.match("income_c") is None
+
+
+def test_digits_are_never_changed():
+
+    index = ColumnIndex(IHDP_COLUMNS + ["score_2019", "score_2020"])
+    for name in ["x30", "x40", "x99", "x255", "x0"]:
+        assert index.match(name) is None
+    assert index.match("X3") == "x3"
+    assert index.match("score_2021") is None
+    assert index.match("scroe_2019") == "score_2019"
+
+
+def test_edit_distance():
+
+    assert edit_distance("kitten", "sitting") == 3
+    assert edit_distance("", "abc") == 3
+    assert edit_distance("same", "same") == 0
+
+
+def test_validation_prints_repairs_and_drops_unknown_names(capsys):
+
+    dict_graph = {"treatment": "treatment", "outcome": "Y", "other_vars": ["x3", "x30"],
+                  "edges": [("x30", "y"), ("x3", "treatment"), ("x3", "y"), ("treatmnt", "y")],
+                  "unobserved_vars": None, "unobserved_edges": None}
+    repaired, faulty = validate_formalized_query(dict_graph, ColumnIndex(IHDP_COLUMNS))
+    output = capsys.readouterr().out
+
+    assert faulty == {}
+    assert repaired["other_vars"] == ["x3"]
+    assert repaired["edges"] == [("x3", "treatment"), ("x3", "y"), ("treatment", "y")]
+    assert "Repaired 'treatmnt' to the column 'treatment'" in output
+    assert "Dropping invalid edge x30 -> y" in output
@@ -13,13 +13,9 @@ def format_graph_DOT(graph):
         (str) string representation of the graph
     """
 
-    str_graph = "digraph {\n"
-    for edge in graph.edges():
-        str_graph += f"{edge[0]} -> {edge[1]};\n"
+    str_edges = "".join([f"{u} -> {v};\n" for u, v in graph.edges()])
 
-    str_graph += "}"
-
-    return str_graph
+    return "digraph {\n" + str_edges + "}"
 
 def filter_str(text):
     """
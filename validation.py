@@ -0,0 +1,189 @@
+## This file contains functions for validating the GPT responses against the columns of the dataset
+import re
+import difflib
+from collections import defaultdict
+
+
+def normalize_name(name):
+    """
+    Normalizes a variable name so that differences in case, spacing and punctuation are ignored
+
+    Args:
+        name: (str) the variable name
+
+    Returns:
+        (str)
+    """
+
+    return re.sub("[^a-z0-9]+", "", str(name).lower())
+
+
+def trigrams(name):
+    """
+    Computes the character trigrams of the (padded) name
+
+    Args:
+        name: (str) normalized variable name
+
+    Returns:
+        (set[str])
+    """
+
+    padded = f"##{name}#"
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """
+    Computes the Levenshtein distance between two names
+
+    Args:
+        a: (str)
+        b: (str)
+
+    Returns:
+        (int)
+    """
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+
+    return previous[-1]
+
+
+class ColumnIndex:
+    """
+    Index over the columns of the dataset used to match variable names given by GPT to the columns.
+    Names are first matched exactly, then after normalization, and finally by fuzzy matching restricted
+    to the columns that share at least one trigram with the name. A fuzzy match never changes the numbers in
+    the name (x30 is not x3), so short, numbered names such as the IHDP covariates are only matched exactly.
+
+    Attributes:
+        columns: (List[str]) the columns of the dataset
+        cutoff: (float) the minimum similarity ratio for a fuzzy match
+        min_length: (int) names shorter than this (after normalization) are not fuzzy matched
+        max_edits: (int) the largest edit distance of a fuzzy match
+    """
+
+    def __init__(self, columns, cutoff=0.8, min_length=4, max_edits=2):
+
+        self.columns = list(columns)
+        self.cutoff = cutoff
+        self.min_length = min_length
+        self.max_edits = max_edits
+        self.exact = {str(col): col for col in self.columns}
+        self.normalized = {}
+        self.trigram_index = defaultdict(set)
+        for col in self.columns:
+            norm = normalize_name(col)
+            self.normalized.setdefault(norm, col)
+            for gram in trigrams(norm):
+                self.trigram_index[gram].add(norm)
+
+    def match(self, name):
+        """
+        Matches the name to a column of the dataset
+
+        Args:
+            name: (str / None) the variable name
+
+        Returns:
+            (str / None) the matched column, None if there is no match or the match is ambiguous
+        """
+
+        if name is None:
+            return None
+        name = str(name).strip().strip(".").strip("`'\"")
+        if name in self.exact:
+            return self.exact[name]
+        norm = normalize_name(name)
+        if norm in self.normalized:
+            return self.normalized[norm]
+        if len(norm) < self.min_length:
+            return None
+
+        numbers = re.findall("[0-9]+", norm)
+        candidates = set()
+        for gram in trigrams(norm):
+            candidates.update(self.trigram_index.get(gram, ()))
+        candidates = [cand for cand in candidates if re.findall("[0-9]+", cand) == numbers and
+                      edit_distance(norm, cand) <= self.max_edits]
+        scores = sorted(((difflib.SequenceMatcher(None, norm, cand).ratio(), cand) for cand in candidates),
+                        reverse=True)
+        if len(scores) == 0 or scores[0][0] < self.cutoff:
+            return None
+        if len(scores) > 1 and scores[1][0] == scores[0][0]:
+            return None
+
+        return self.normalized[scores[0][1]]
+
+
+def validate_formalized_query(dict_graph, index):
+    """
+    Validates the restructured GPT response (see gpt.restructure_gpt_response) against the columns of the
+    dataset. Misspelled names are repaired (every repair is printed), unknown covariates and invalid edges
+    are dropped.
+
+    Args:
+        dict_graph: (dict) the restructured GPT response
+        index: (ColumnIndex) index over the columns of the dataset
+
+    Returns:
+        (dict) the repaired response
+        (dict) maps the prompt keys (treat / outcome / edges) that need to be asked again to the reason
+    """
+
+    faulty = {}
+    repaired = dict(dict_graph)
+    unobserved = set(dict_graph["unobserved_vars"] or [])
+    repairs = {}
+
+    def resolve(name):
+        if name in unobserved:
+            return name
+        matched = index.match(name)
+        if matched is not None and normalize_name(matched) != normalize_name(name) and name not in repairs:
+            repairs[name] = matched
+            print(f"Repaired '{name}' to the column '{matched}'")
+        return matched
+
+    treatment = resolve(dict_graph["treatment"])
+    outcome = resolve(dict_graph["outcome"])
+    if treatment is None:
+        faulty["treat"] = f"'{dict_graph['treatment']}' is not a variable in the data."
+    if outcome is None:
+        faulty["outcome"] = f"'{dict_graph['outcome']}' is not a variable in the data."
+    elif outcome == treatment:
+        faulty["outcome"] = f"'{outcome}' is the treatment variable."
+    repaired["treatment"] = treatment
+    repaired["outcome"] = outcome
+
+    other_vars = []
+    for var in dict_graph["other_vars"]:
+        matched = resolve(var)
+        if matched is None:
+            print(f"Dropping '{var}' since it is not a variable in the data")
+        elif matched not in other_vars and matched not in [treatment, outcome]:
+            other_vars.append(matched)
+
+    edges = []
+    for u, v in dict_graph["edges"]:
+        edge = (resolve(u), resolve(v))
+        if edge[0] is None or edge[1] is None or edge[0] == edge[1]:
+            print(f"Dropping invalid edge {u} -> {v}")
+        elif edge not in edges:
+            edges.append(edge)
+            for node in edge:
+                if node not in other_vars and node not in unobserved and node not in [treatment, outcome]:
+                    other_vars.append(node)
+    if len(edges) == 0:
+        faulty["edges"] = "None of the edges connect variables in the data."
+    repaired["other_vars"] = other_vars
+    repaired["edges"] = edges
+
+    return repaired, faulty